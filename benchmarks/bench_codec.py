@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import time
+from base64 import b64encode, b64decode
+from Crypto.Cipher import AES
+from xcomfort.codec import FrameCodec, json_backend
+from xcomfort.connection import _pad_string
+
+KEY = os.urandom(32)
+IV = os.urandom(16)
+
+
+def legacy_decode(data):
+    data = AES.new(KEY, AES.MODE_CBC, IV).decrypt(b64decode(data)).rstrip(b'\x00')
+    return json.loads(data.decode()) if data else {}
+
+
+def legacy_encode(data):
+    msg = _pad_string(json.dumps(data).encode())
+    return b64encode(AES.new(KEY, AES.MODE_CBC, IV).encrypt(msg)).decode() + '\u0004'
+
+
+def state_info(items):
+    return {"type_int": 310, "mc": 12, "payload": {"item": [
+        {"deviceId": i, "switch": True, "dimmvalue": 50} for i in range(items)]}}
+
+
+def all_data(devices):
+    return {"type_int": 300, "mc": 2, "payload": {"devices": [
+        {"deviceId": i, "name": f"Light {i}", "devType": 100, "compId": 1, "dimmable": True,
+         "switch": False, "dimmvalue": 0} for i in range(devices)]}}
+
+
+def measure(fn, arg, duration):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for _ in range(100):
+            fn(arg)
+        count += 100
+    return count / (time.perf_counter() - start)
+
+
+def main(args):
+    cases = [
+        ("SET_STATE_INFO x1", state_info(1)),
+        ("SET_STATE_INFO x20", state_info(20)),
+        ("SET_ALL_DATA x2000", all_data(2000)),
+    ]
+    backends = [name for name in ("json", "ujson", "orjson") if _available(name)]
+
+    for label, message in cases:
+        frame = legacy_encode(message)
+        print(f"{label} ({len(frame)} bytes)")
+        print(f"  decode legacy        {measure(legacy_decode, frame, args.duration):>10.0f} frames/s")
+        for name in backends:
+            codec = FrameCodec(KEY, IV, json_backend(name))
+            print(f"  decode codec/{name:<7}{measure(codec.decode, frame, args.duration):>10.0f} frames/s")
+
+        print(f"  encode legacy        {measure(legacy_encode, message, args.duration):>10.0f} frames/s")
+        for name in backends:
+            codec = FrameCodec(KEY, IV, json_backend(name))
+            print(f"  encode codec/{name:<7}{measure(codec.encode, message, args.duration):>10.0f} frames/s")
+
+
+def _available(name):
+    try:
+        json_backend(name)
+        return True
+    except ImportError:
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frame encode/decode throughput")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per measurement")
+    main(parser.parse_args())
@@ -0,0 +1,44 @@
+import argparse
+import gc
+import json
+import tracemalloc
+from mock import Mock
+from xcomfort.bridge import Bridge
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+def measure(devices, updates, raw_payload_keys):
+    simulator = BridgeSimulator("benchmark", SimulatorConfig(devices=devices, rooms=devices // 20, comps=devices // 20, seed=1))
+    # Kept as JSON so the decoded payloads are allocated while tracing, as
+    # they would be when read from the socket
+    chunks = [json.dumps(chunk) for chunk in simulator.all_data_chunks()]
+    state_updates = [json.dumps({"item": [simulator.random_state_item() for _ in range(10)]}) for _ in range(updates // 10)]
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    bridge = Bridge("127.0.0.1", "benchmark", session=Mock(), raw_payload_keys=raw_payload_keys)
+    for chunk in chunks:
+        bridge._handle_SET_ALL_DATA(json.loads(chunk))
+    for payload in state_updates:
+        bridge._handle_SET_STATE_INFO(json.loads(payload))
+
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return retained / devices
+
+
+def main(args):
+    for label, keys in (("raw kept (None)", None), ("raw dropped (())", ()), ("raw keys ('switch',)", ("switch",))):
+        print(f"{label:<22} {measure(args.devices, args.updates, keys):>8.0f} bytes/device")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retained memory per device")
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--updates", type=int, default=50000)
+    main(parser.parse_args())
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import time
+from xcomfort import Bridge
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+async def main(args):
+    config = SimulatorConfig(
+        devices=args.devices,
+        rooms=args.rooms,
+        comps=args.comps,
+        state_rate=args.rate,
+        state_batch=args.batch,
+        latency=args.latency,
+        rsa_bits=1024,
+        seed=1,
+    )
+
+    async with BridgeSimulator("benchmark", config) as simulator:
+        bridge = Bridge(simulator.ip_address, "benchmark")
+        run_task = asyncio.create_task(bridge.run())
+
+        start = time.perf_counter()
+        devices = await bridge.get_devices()
+        ready = time.perf_counter() - start
+
+        received = 0
+
+        def on_state(_):
+            nonlocal received
+            received += 1
+
+        for device in devices.values():
+            device.state.subscribe(on_state)
+
+        received = 0
+        start = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - start
+
+        await bridge.close()
+        await run_task
+
+    print(f"devices={len(devices)} time_to_ready={ready * 1000:.1f}ms")
+    print(f"state updates: sent={simulator.stats.state_updates_sent} "
+          f"received={received} ({received / elapsed:.0f}/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bridge throughput against the local simulator")
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--comps", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=500.0, help="SET_STATE_INFO frames per second")
+    parser.add_argument("--batch", type=int, default=10, help="state items per frame")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--duration", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from mock import Mock
+from xcomfort.bridge import Bridge
+from xcomfort.coalesce import CommandCoalescer
+from xcomfort.messages import Messages, ShadeOperationState
+
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message_type, payload, wait_for_ack=None):
+        self.sent.append(payload)
+        return payload
+
+
+@pytest.mark.asyncio
+async def test_only_newest_value_is_sent_within_window():
+    recorder = Recorder()
+    coalescer = CommandCoalescer(recorder.send, window=0.05)
+
+    results = await asyncio.gather(*(coalescer.submit("dimm", 280, {"dimmvalue": v}) for v in range(10)))
+
+    assert recorder.sent == [{"dimmvalue": 0}, {"dimmvalue": 9}]
+    assert results[5] == {"dimmvalue": 9}
+    assert coalescer.frames_saved == 8
+
+
+@pytest.mark.asyncio
+async def test_flush_sends_pending_command_immediately():
+    recorder = Recorder()
+    coalescer = CommandCoalescer(recorder.send, window=10)
+
+    await coalescer.submit("dimm", 280, {"dimmvalue": 1})
+    pending = asyncio.ensure_future(coalescer.submit("dimm", 280, {"dimmvalue": 2}))
+    await asyncio.sleep(0)
+
+    await coalescer.flush("dimm")
+
+    assert await pending == {"dimmvalue": 2}
+    assert recorder.sent == [{"dimmvalue": 1}, {"dimmvalue": 2}]
+
+
+def _recording_bridge(window):
+    bridge = Bridge("127.0.0.1", "", session=Mock(), coalesce_window=window)
+    sent = []
+
+    async def send_now(message_type, message, wait_for_ack=None):
+        sent.append((message, wait_for_ack))
+        return message
+
+    bridge._send_now = send_now
+    bridge.coalescer._send = send_now
+
+    return bridge, sent
+
+
+@pytest.mark.asyncio
+async def test_stop_drops_held_go_to():
+    bridge, sent = _recording_bridge(window=10)
+    go_to = {"deviceId": 1, "state": ShadeOperationState.GO_TO}
+
+    await bridge.send_message(Messages.SET_DEVICE_SHADING_STATE, {**go_to, "value": 20})
+    held = asyncio.ensure_future(bridge.send_message(Messages.SET_DEVICE_SHADING_STATE, {**go_to, "value": 80}))
+    await asyncio.sleep(0)
+
+    await bridge.send_message(Messages.SET_DEVICE_SHADING_STATE, {"deviceId": 1, "state": ShadeOperationState.STOP})
+
+    assert await held is None
+    assert [message.get("value") for message, _ in sent] == [20, None]
+
+
+@pytest.mark.asyncio
+async def test_switch_does_not_wait_for_ack_of_held_slide():
+    bridge, sent = _recording_bridge(window=10)
+    bridge.wait_for_ack = True
+
+    await bridge.send_message(Messages.ACTION_SLIDE_DEVICE, {"deviceId": 1, "dimmvalue": 20})
+    held = asyncio.ensure_future(bridge.send_message(Messages.ACTION_SLIDE_DEVICE, {"deviceId": 1, "dimmvalue": 50}))
+    await asyncio.sleep(0)
+
+    await bridge.send_message(Messages.ACTION_SWITCH_DEVICE, {"deviceId": 1, "switch": False})
+
+    assert sent[1:] == [({"deviceId": 1, "dimmvalue": 50}, False), ({"deviceId": 1, "switch": False}, None)]
+    await held
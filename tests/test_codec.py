@@ -0,0 +1,53 @@
+import json
+import pytest
+from base64 import b64encode
+from Crypto.Cipher import AES
+from xcomfort.codec import FrameCodec, json_backend, decode_frame
+from xcomfort.connection import _pad_string
+from xcomfort.messages import ShadeOperationState
+
+KEY = bytes(range(32))
+IV = bytes(range(16))
+
+
+def legacy_encode(data):
+    msg = _pad_string(json.dumps(data).encode())
+    return b64encode(AES.new(KEY, AES.MODE_CBC, IV).encrypt(msg)).decode() + '\u0004'
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+@pytest.mark.parametrize("size", [0, 10, 5000])
+def test_decode_matches_legacy_frames(backend, size):
+    if backend == "orjson":
+        pytest.importorskip("orjson")
+
+    message = {"type_int": 300, "mc": 4, "payload": {"devices": [{"deviceId": i, "name": "x"} for i in range(size)]}}
+    codec = FrameCodec(KEY, IV, json_backend(backend))
+
+    assert codec.decode(legacy_encode(message)) == message
+
+
+def test_encode_roundtrip_with_enums():
+    codec = FrameCodec(KEY, IV)
+    message = {"type_int": 355, "mc": 1, "payload": {"state": ShadeOperationState.STOP}}
+
+    assert codec.decode(codec.encode(message)) == {"type_int": 355, "mc": 1, "payload": {"state": 2}}
+
+
+def test_empty_frame_decodes_to_empty_message():
+    codec = FrameCodec(KEY, IV)
+    frame = b64encode(AES.new(KEY, AES.MODE_CBC, IV).encrypt(b'\x00' * 16)).decode()
+
+    assert codec.decode(frame) == {}
+
+
+def test_decode_frame_runs_in_process_pool():
+    from concurrent.futures import ProcessPoolExecutor
+
+    codec = FrameCodec(KEY, IV)
+    frame = codec.encode({"type_int": 300, "payload": {"lastItem": True}})
+
+    with ProcessPoolExecutor(1) as executor:
+        result = executor.submit(decode_frame, *codec.offload_args(), frame).result()
+
+    assert result == {"type_int": 300, "payload": {"lastItem": True}}
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from xcomfort.bridge import Bridge
+from xcomfort.connection import CommandNackError, CommandTimeoutError
+from xcomfort.messages import Messages
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+async def _start(simulator):
+    bridge = Bridge(simulator.ip_address, "secret")
+    bridge.wait_for_ack = True
+    run_task = asyncio.create_task(bridge.run())
+    devices = await asyncio.wait_for(bridge.get_devices(), 10)
+
+    return bridge, run_task, devices
+
+
+@pytest.mark.asyncio
+async def test_command_resolves_on_ack():
+    async with BridgeSimulator("secret", SimulatorConfig(devices=2, rsa_bits=1024)) as simulator:
+        bridge, run_task, devices = await _start(simulator)
+
+        ack = await bridge.switch_device(1, {"switch": True})
+
+        assert ack["type_int"] == Messages.ACK
+        assert simulator.devices[1]["switch"] == True
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_command_raises_on_nack():
+    async with BridgeSimulator("secret", SimulatorConfig(devices=2, rsa_bits=1024)) as simulator:
+        bridge, run_task, devices = await _start(simulator)
+
+        with pytest.raises(CommandNackError) as error:
+            await bridge.switch_device(99, {"switch": True})
+
+        assert error.value.info == Messages.NACK_INFO_UNKNOWN_DEVICE
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_dropped_command_is_retried_then_times_out():
+    config = SimulatorConfig(devices=2, rsa_bits=1024, drop_rate=1.0)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge, run_task, devices = await _start(simulator)
+        bridge.command_timeout = 0.05
+        bridge.command_retries = 2
+
+        with pytest.raises(CommandTimeoutError):
+            await bridge.switch_device(1, {"switch": True})
+
+        assert simulator.stats.commands_dropped == 3
+
+        await bridge.close()
+        await run_task
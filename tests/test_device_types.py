@@ -0,0 +1,81 @@
+import pytest
+from mock import Mock
+from xcomfort.bridge import Bridge
+from xcomfort.devices import (BridgeDevice, DecodedDevice, StateDecoder, Light, DEVICE_TYPES, COMP_TYPES,
+                              register_device_type)
+
+
+@pytest.fixture
+def registry():
+    saved = dict(DEVICE_TYPES), dict(COMP_TYPES)
+    yield
+    DEVICE_TYPES.clear()
+    DEVICE_TYPES.update(saved[0])
+    COMP_TYPES.clear()
+    COMP_TYPES.update(saved[1])
+
+
+def test_builtin_types_are_registered():
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+
+    bridge._handle_device_payload({"deviceId": 1, "name": "A", "devType": 101, "compId": 1, "dimmable": True,
+                                   "switch": True, "dimmvalue": 10})
+    bridge._handle_device_payload({"deviceId": 2, "name": "B", "devType": 999, "compId": 1})
+
+    assert isinstance(bridge._devices[1], Light)
+    assert type(bridge._devices[2]) is BridgeDevice
+
+
+def test_registered_type_decodes_only_its_fields(registry):
+    @register_device_type(220)
+    class WindowSensor(DecodedDevice):
+        decoder = StateDecoder("WindowSensorState", {"is_open": ("curstate", bool), "battery": "battery"})
+
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+    states = []
+
+    bridge._handle_device_payload({"deviceId": 3, "name": "Window", "devType": 220, "compId": 1,
+                                   "curstate": 0, "battery": 80, "info": [{"text": "x"}] * 20})
+    sensor = bridge._devices[3]
+    sensor.state.subscribe(states.append)
+
+    bridge._handle_SET_STATE_INFO({"item": [{"deviceId": 3, "curstate": 1}]})
+    bridge._handle_SET_STATE_INFO({"item": [{"deviceId": 3, "curstate": 1, "unrelated": 5}]})
+
+    assert isinstance(sensor, WindowSensor)
+    assert [(state.is_open, state.battery) for state in states] == [(False, 80), (True, 80)]
+    assert states[-1].raw is None
+    assert str(states[-1]) == "WindowSensorState(is_open=True, battery=80)"
+
+    with pytest.raises(AttributeError):
+        states[-1].is_open = False
+
+
+def test_comp_type_fallback(registry):
+    class Actuator(BridgeDevice):
+        pass
+
+    register_device_type(comp_types=77, device_class=Actuator)
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+
+    bridge._handle_comp_payload({"compId": 4, "name": "Comp", "compType": 77})
+    bridge._handle_device_payload({"deviceId": 5, "name": "Unknown", "devType": 998, "compId": 4})
+
+    assert isinstance(bridge._devices[5], Actuator)
+
+
+def test_comp_type_fallback_in_full_download(registry):
+    class Actuator(BridgeDevice):
+        pass
+
+    register_device_type(comp_types=77, device_class=Actuator)
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+
+    bridge._handle_SET_ALL_DATA({
+        "devices": [{"deviceId": 5, "name": "Unknown", "devType": 998, "compId": 4}],
+        "comps": [{"compId": 4, "name": "Comp", "compType": 77}],
+        "lastItem": True,
+    })
+
+    assert isinstance(bridge._devices[5], Actuator)
+    assert bridge._devices[5].component is bridge._comps[4]
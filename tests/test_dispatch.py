@@ -0,0 +1,42 @@
+import pytest
+from mock import Mock
+from xcomfort.bridge import Bridge
+from xcomfort.messages import Messages
+
+
+def make_bridge():
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+    bridge.logger = Mock()
+    return bridge
+
+
+def test_unknown_message_type_goes_to_fallback():
+    bridge = make_bridge()
+
+    bridge._onMessage({"type_int": 9999, "payload": {"x": 1}})
+
+    bridge.logger.assert_called_once_with("Unhandled package [9999]: {'x': 1}")
+
+
+def test_registered_handler_overrides_and_can_be_restored():
+    bridge = make_bridge()
+    received = []
+
+    previous = bridge.register_handler(Messages.SET_STATE_INFO, received.append)
+    bridge._onMessage({"type_int": 310, "payload": {"item": []}})
+
+    assert received == [{"item": []}]
+    assert previous == bridge._handle_SET_STATE_INFO
+
+    bridge.unregister_handler(Messages.SET_STATE_INFO)
+    assert bridge._handlers[310] == bridge._handle_SET_STATE_INFO
+
+
+def test_handler_for_message_without_builtin_handling():
+    bridge = make_bridge()
+    received = []
+
+    bridge.register_handler(Messages.DIAGNOSTICS, received.append)
+    bridge._onMessage({"type_int": 243, "payload": {"uptime": 5}})
+
+    assert received == [{"uptime": 5}]
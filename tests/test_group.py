@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from xcomfort.group import BridgeGroup
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+@pytest.mark.asyncio
+async def test_group_merges_bridges_on_one_session():
+    config = SimulatorConfig(devices=5, rooms=2, comps=1, rsa_bits=1024)
+
+    async with BridgeSimulator("a", config) as first, BridgeSimulator("b", config) as second:
+        group = BridgeGroup(stagger=0.01)
+        group.add_bridge("north", first.ip_address, "a")
+        group.add_bridge("south", second.ip_address, "b")
+
+        states = []
+        group.states.subscribe(states.append)
+
+        run_task = asyncio.create_task(group.run())
+        await asyncio.wait_for(group.wait_for_initialization(), 10)
+
+        assert len(group.devices) == 10
+        assert group.devices[("south", 3)] is group.bridges["south"]._devices[3]
+        assert ("north", 5) in group.devices
+        assert len(group.rooms) == 4
+        assert {s.bridge_key for s in states} == {"north", "south"}
+        assert group.bridges["north"]._session is group.bridges["south"]._session
+
+        await group.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_group_follows_live_topology_changes():
+    group = BridgeGroup()
+    bridge = group.add_bridge("home", "127.0.0.1", "")
+
+    states = []
+    group.states.subscribe(states.append)
+
+    light = {"deviceId": 1, "name": "Light", "devType": 100, "compId": 1, "dimmable": False, "switch": False}
+    bridge._onMessage({"type_int": 290, "payload": light})
+    bridge._onMessage({"type_int": 292, "payload": {"deviceId": 1, "name": "Hall"}})
+    bridge._onMessage({"type_int": 310, "payload": {"item": [{"deviceId": 1, "switch": True}]}})
+    assert len(states) == 2
+
+    device = bridge._devices[1]
+    bridge._onMessage({"type_int": 296, "payload": {"deviceId": 1}})
+    device.handle_state({"switch": False})
+    assert len(states) == 2
+
+    await group.close()
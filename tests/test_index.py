@@ -0,0 +1,60 @@
+from mock import Mock
+from xcomfort.bridge import Bridge
+from xcomfort.devices import Light, Shade
+from xcomfort.messages import Messages
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+def loaded_bridge():
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+    simulator = BridgeSimulator("", SimulatorConfig(devices=12, rooms=3, comps=2, seed=1))
+
+    for chunk in simulator.all_data_chunks():
+        bridge._handle_SET_ALL_DATA(chunk)
+
+    return bridge, simulator
+
+
+def test_queries_match_linear_scans():
+    bridge, simulator = loaded_bridge()
+    devices = bridge._devices.values()
+
+    in_room = bridge.find_devices(room_id=2, device_class=Light)
+    assert sorted(d.device_id for d in in_room) == simulator.rooms[2]["devices"]
+
+    on_comp = bridge.find_devices(comp_id=1, dev_type=100)
+    assert on_comp and sorted(on_comp, key=lambda d: d.device_id) == \
+        sorted((d for d in devices if d.comp_id == 1 and d.dev_type == 100), key=lambda d: d.device_id)
+
+    assert bridge.find_devices(name="Light 5") == [bridge._devices[5]]
+    assert bridge.find_devices(room_id=1, comp_id=99) == []
+    assert [room.room_id for room in bridge.find_rooms(device_id=5)] == [2]
+    assert len(bridge.find_comps(comp_type=83)) == 2
+
+
+def test_indexes_follow_topology_changes():
+    bridge, _ = loaded_bridge()
+
+    bridge._onMessage({"type_int": Messages.SET_DEVICE_INFO.value, "payload": {"deviceId": 5, "name": "Porch"}})
+    bridge._onMessage({"type_int": Messages.SET_ROOM_INFO.value, "payload": {"roomId": 2, "devices": [5, 7]}})
+    bridge._onMessage({"type_int": Messages.DEVICE_DELETED.value, "payload": {"deviceId": 7}})
+
+    assert bridge.find_devices(name="Light 5") == []
+    assert bridge.find_devices(name="Porch") == [bridge._devices[5]]
+    assert [d.device_id for d in bridge.find_devices(room_id=2)] == [5]
+    assert bridge.find_rooms(device_id=2) == []
+
+
+def test_shade_component_is_linked_when_comp_arrives():
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+
+    bridge._handle_device_payload({"deviceId": 1, "name": "Blind", "devType": 102, "compId": 9, "shRuntime": 1})
+    shade = bridge._devices[1]
+    assert isinstance(shade, Shade)
+    assert shade.supports_go_to is None
+
+    bridge._handle_comp_payload({"compId": 9, "name": "Shutter", "compType": 86})
+    assert shade.supports_go_to == True
+
+    bridge._onMessage({"type_int": Messages.COMP_DELETED.value, "payload": {"compId": 9}})
+    assert shade.supports_go_to is None
@@ -48,3 +48,27 @@ def test_lightstate_switch_on_when_not_dimmable():
     device.handle_state(payload)
 
     assert device.state.value.switch == True
+
+
+def test_unchanged_state_is_not_reemitted():
+    device = Light(None, 1, "", True)
+    emitted = []
+    device.state.subscribe(emitted.append)
+
+    device.handle_state({"switch": True, "dimmvalue": 50})
+    device.handle_state({"switch": True, "dimmvalue": 50, "power": 1.5})
+
+    assert emitted[1:] == [device.state.value]
+
+
+def test_delta_reports_changed_fields_and_previous_values():
+    device = Light(None, 1, "", True)
+    deltas = []
+    device.deltas.subscribe(deltas.append)
+
+    device.handle_state({"switch": True, "dimmvalue": 50})
+    device.handle_state({"switch": True, "dimmvalue": 70})
+
+    assert deltas[0].changed == {"switch": True, "dimmvalue": 50}
+    assert deltas[1].changed == {"dimmvalue": 70}
+    assert deltas[1].previous == {"dimmvalue": 50}
@@ -0,0 +1,149 @@
+import asyncio
+import pytest
+from mock import Mock
+from xcomfort.bridge import Bridge
+from xcomfort.connection import CommandNackError, CommandTimeoutError
+from xcomfort.devices import Shade
+from xcomfort.messages import Messages
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+async def _start(simulator, optimistic=True):
+    bridge = Bridge(simulator.ip_address, "secret")
+    bridge.optimistic = optimistic
+    bridge.command_retries = 0
+    run_task = asyncio.create_task(bridge.run())
+    devices = await asyncio.wait_for(bridge.get_devices(), 10)
+
+    return bridge, run_task, devices
+
+
+def _record(device):
+    states = []
+    device.state.subscribe(lambda state: states.append((state.switch, state.dimmvalue, state.pending)))
+    return states
+
+
+@pytest.mark.asyncio
+async def test_switch_is_published_pending_then_confirmed():
+    config = SimulatorConfig(devices=2, rooms=1, comps=1, latency=0.05, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge, run_task, devices = await _start(simulator)
+        light = devices[1]
+        states = _record(light)
+
+        command = asyncio.create_task(light.switch(True))
+        await asyncio.sleep(0)
+        assert light.state.value.pending and light.state.value.switch
+
+        await command
+        await light.wait_for_state(lambda state: not state.pending, timeout=5)
+
+        assert states[0][2] == False
+        assert states[1] == (True, states[0][1], True)
+        assert states[-1][0] == True and states[-1][2] == False
+        assert light.confirmed_state is light.state.value
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_on_nack():
+    config = SimulatorConfig(devices=4, rooms=1, comps=1, dimmable_ratio=0.0, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge, run_task, devices = await _start(simulator)
+        light = devices[1]
+        before = light.state.value
+        states = _record(light)
+
+        with pytest.raises(CommandNackError):
+            await light.dimm(50)
+
+        assert states[1][2] == True
+        assert light.state.value is before
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_on_timeout():
+    config = SimulatorConfig(devices=2, rooms=1, comps=1, drop_rate=1.0, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge, run_task, devices = await _start(simulator)
+        bridge.command_timeout = 0.1
+        light = devices[1]
+        before = light.state.value
+
+        with pytest.raises(CommandTimeoutError):
+            await light.switch(True)
+
+        assert light.state.value is before
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_not_optimistic_by_default():
+    config = SimulatorConfig(devices=2, rooms=1, comps=1, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge, run_task, devices = await _start(simulator, optimistic=False)
+        light = devices[1]
+        states = _record(light)
+
+        await light.switch(True)
+        await light.wait_for_state(lambda state: state.switch, timeout=5)
+
+        assert not any(pending for _, _, pending in states)
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_when_ack_is_not_followed_by_an_update():
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+    bridge.optimistic = True
+    bridge.optimistic_timeout = 0.05
+
+    async def switch_device(device_id, message):
+        return {"type_int": Messages.ACK.value}
+
+    bridge.switch_device = switch_device
+    bridge._handle_device_payload({"deviceId": 1, "name": "A", "devType": 100, "compId": 1, "dimmable": False,
+                                   "switch": False})
+    light = bridge._devices[1]
+    before = light.state.value
+
+    await light.switch(True)
+    assert light.state.value.pending
+
+    await light.wait_for_state(lambda state: not state.pending, timeout=1)
+    assert light.state.value is before
+
+
+@pytest.mark.asyncio
+async def test_shade_open_is_not_published_pending():
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+    bridge.optimistic = True
+    sent = []
+
+    async def send_message(message_type, message):
+        sent.append(message)
+
+    bridge.send_message = send_message
+    shade = Shade(bridge, 1, "Blind", 2, {})
+    shade.handle_state({"shPos": 10})
+    states = []
+    shade.state.subscribe(states.append)
+
+    await shade.move_up()
+
+    assert len(sent) == 1
+    assert len(states) == 1 and not states[0].pending
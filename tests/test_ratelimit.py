@@ -0,0 +1,85 @@
+import asyncio
+import time
+import pytest
+from xcomfort.connection import SecureBridgeConnection, SendPriority
+from xcomfort.messages import Messages
+from xcomfort.ratelimit import AdaptiveRateLimiter
+
+
+@pytest.mark.asyncio
+async def test_burst_then_paced_at_rate():
+    limiter = AdaptiveRateLimiter(rate=100.0, burst=5)
+
+    start = time.monotonic()
+    for _ in range(15):
+        await limiter.acquire()
+    elapsed = time.monotonic() - start
+
+    assert 0.08 <= elapsed < 0.5
+
+
+def test_fast_acks_raise_rate_and_slow_acks_cut_it():
+    limiter = AdaptiveRateLimiter(rate=10.0, max_rate=12.0, increase=1.0, decrease=0.5, target_latency=0.2)
+
+    for _ in range(5):
+        limiter.record_ack(0.01)
+    assert limiter.rate == 12.0
+
+    limiter.record_ack(1.0)
+    assert limiter.rate == 6.0
+
+    # Only one decrease per cooldown
+    limiter.record_timeout()
+    assert limiter.rate == 6.0
+
+
+def test_client_error_nacks_do_not_slow_down():
+    limiter = AdaptiveRateLimiter(rate=10.0)
+
+    limiter.record_nack(Messages.NACK_INFO_UNKNOWN_DEVICE)
+    assert limiter.rate == 10.0
+
+    limiter.record_nack("busy")
+    assert limiter.rate == 5.0
+
+
+class _SilentWebsocket:
+    async def send_str(self, data):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_unanswered_commands_time_out_without_further_sends():
+    limiter = AdaptiveRateLimiter(rate=10.0)
+    connection = SecureBridgeConnection(_SilentWebsocket(), bytes(32), bytes(16), "client")
+    connection.rate_limiter = limiter
+
+    await connection.send_message(Messages.ACTION_SWITCH_DEVICE, {"deviceId": 1}, timeout=0.05)
+    await asyncio.sleep(0.1)
+
+    assert limiter.timeouts == 1
+    assert limiter.rate == 5.0
+    assert not connection._sent_at
+
+
+@pytest.mark.asyncio
+async def test_urgent_callers_are_not_queued_behind_bulk():
+    limiter = AdaptiveRateLimiter(rate=20.0, burst=1)
+    order = []
+
+    async def acquire(name, priority):
+        await limiter.acquire(priority)
+        order.append(name)
+
+    bulk = [asyncio.ensure_future(acquire(f"bulk{i}", SendPriority.BULK)) for i in range(40)]
+    await asyncio.sleep(0)
+
+    started = time.monotonic()
+    await acquire("stop", SendPriority.SAFETY)
+    assert time.monotonic() - started < 0.01
+
+    await acquire("switch", SendPriority.INTERACTIVE)
+    assert order[:3] == ["bulk0", "stop", "switch"]
+
+    for task in bulk:
+        task.cancel()
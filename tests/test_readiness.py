@@ -0,0 +1,108 @@
+import asyncio
+import pytest
+from mock import Mock
+from xcomfort.bridge import Bridge, InitializationError, InitializationTimeoutError, State
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+def make_bridge():
+    return Bridge("127.0.0.1", "", session=Mock())
+
+
+def topology_chunks(devices=4):
+    simulator = BridgeSimulator("", SimulatorConfig(devices=devices, rooms=1, comps=1, chunk_size=2, seed=1))
+    return list(simulator.all_data_chunks())
+
+
+@pytest.mark.asyncio
+async def test_ready_only_after_last_chunk_is_ingested():
+    bridge = make_bridge()
+    first, *rest = topology_chunks()
+    waiter = asyncio.create_task(bridge.get_devices())
+
+    bridge._handle_SET_ALL_DATA(first)
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    for chunk in rest:
+        bridge._handle_SET_ALL_DATA(chunk)
+
+    devices = await asyncio.wait_for(waiter, 1)
+
+    assert bridge.state == State.Ready
+    assert len(devices) == 4
+
+
+@pytest.mark.asyncio
+async def test_wait_for_initialization_times_out_with_context():
+    bridge = make_bridge()
+
+    with pytest.raises(InitializationTimeoutError, match="state=Uninitialized"):
+        await bridge.wait_for_initialization(timeout=0.01)
+
+
+@pytest.mark.asyncio
+async def test_close_wakes_waiters_with_error():
+    bridge = make_bridge()
+    waiter = asyncio.create_task(bridge.wait_for_initialization())
+    await asyncio.sleep(0)
+
+    await bridge.close()
+
+    with pytest.raises(InitializationError):
+        await asyncio.wait_for(waiter, 1)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_state_matches_predicate():
+    bridge = make_bridge()
+    for chunk in topology_chunks():
+        bridge._handle_SET_ALL_DATA(chunk)
+
+    light = bridge._devices[1]
+    waiter = asyncio.create_task(bridge.wait_for_state(1, lambda state: state.switch, timeout=1))
+
+    bridge._handle_SET_STATE_INFO({"item": [{"deviceId": 1, "switch": False, "dimmvalue": 0}]})
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    bridge._handle_SET_STATE_INFO({"item": [{"deviceId": 1, "switch": True, "dimmvalue": 50}]})
+
+    state = await waiter
+    assert state is light.state.value
+
+    # Already matching states resolve immediately
+    assert await light.wait_for_state(lambda state: state.switch, timeout=0) is state
+
+    with pytest.raises(asyncio.TimeoutError):
+        await light.wait_for_state(lambda state: not state.switch, timeout=0.01)
+
+
+@pytest.mark.asyncio
+async def test_devices_usable_before_last_chunk():
+    bridge = make_bridge()
+    first, *rest = topology_chunks(devices=6)
+    progress = []
+    bridge.topology_progress.subscribe(progress.append)
+
+    waiter = asyncio.create_task(bridge.wait_for_device(1, timeout=1))
+    await asyncio.sleep(0)
+
+    bridge._handle_SET_ALL_DATA(first)
+    device = await waiter
+
+    assert device.device_id == 1
+    assert bridge.state != State.Ready
+    assert bridge.time_to_first_device is not None
+    assert bridge.time_to_ready is None
+
+    for chunk in rest:
+        bridge._handle_SET_ALL_DATA(chunk)
+
+    assert [p.chunk for p in progress] == list(range(1, len(rest) + 2))
+    assert [p.last for p in progress] == [False] * len(rest) + [True]
+    assert progress[-1].devices == 6
+    assert bridge.time_to_ready >= bridge.time_to_first_device
+
+    with pytest.raises(KeyError):
+        await bridge.wait_for_device(999, timeout=1)
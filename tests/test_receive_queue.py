@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from xcomfort.receive_queue import ReceiveQueue, OverflowPolicy
+
+
+def state_info(*items):
+    return {"type_int": 310, "payload": {"item": list(items)}}
+
+
+@pytest.mark.asyncio
+async def test_block_waits_for_dispatcher():
+    queue = ReceiveQueue(maxsize=1)
+    await queue.put(state_info({"deviceId": 1, "switch": True}))
+
+    blocked = asyncio.ensure_future(queue.put(state_info({"deviceId": 2, "switch": True})))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    await queue.get()
+    await asyncio.wait_for(blocked, 1)
+    assert queue.stats.max_depth == 1
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_only_drops_state_updates():
+    queue = ReceiveQueue(maxsize=2, policy=OverflowPolicy.DropOldest)
+    topology = {"type_int": 300, "payload": {"devices": []}}
+
+    await queue.put(topology)
+    await queue.put(state_info({"deviceId": 1, "switch": True}))
+    await queue.put(state_info({"deviceId": 2, "switch": False}))
+
+    assert await queue.get() is topology
+    assert (await queue.get())["payload"]["item"][0]["deviceId"] == 2
+    assert queue.stats.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_coalesce_merges_pending_updates_per_entity():
+    queue = ReceiveQueue(policy=OverflowPolicy.Coalesce)
+
+    await queue.put(state_info({"deviceId": 1, "switch": True, "dimmvalue": 10}))
+    await queue.put(state_info({"deviceId": 1, "dimmvalue": 80}, {"deviceId": 2, "switch": True}))
+
+    first = await queue.get()
+    second = await queue.get()
+
+    assert first["payload"]["item"] == [{"deviceId": 1, "switch": True, "dimmvalue": 80}]
+    assert second["payload"]["item"] == [{"deviceId": 2, "switch": True}]
+    assert queue.stats.coalesced == 1
+
+    # Once dispatched, updates for the entity are queued again
+    await queue.put(state_info({"deviceId": 1, "switch": False}))
+    assert len(queue) == 1
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from xcomfort.bridge import Bridge
+from xcomfort.connection import ConnectionDeclinedError
+from xcomfort.reconnect import ReconnectPolicy, ConnectionStatus
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+def test_first_retry_is_immediate_then_backs_off():
+    policy = ReconnectPolicy(base_delay=1.0, multiplier=2.0, max_delay=10.0, jitter=0)
+
+    delays = [policy.next_delay(OSError()) for _ in range(6)]
+
+    assert delays == [0.0, 1.0, 2.0, 4.0, 8.0, 10.0]
+
+
+def test_declined_connection_backs_off_harder():
+    policy = ReconnectPolicy(declined_delay=15.0, jitter=0)
+
+    assert policy.next_delay(ConnectionDeclinedError("all used")) == 15.0
+
+
+def test_circuit_opens_after_repeated_failures():
+    policy = ReconnectPolicy(failure_threshold=3, open_time=120.0, jitter=0)
+
+    for _ in range(2):
+        policy.next_delay(OSError())
+
+    assert policy.next_delay(OSError()) == 120.0
+    assert policy.circuit_open
+
+    policy.reset()
+    assert not policy.circuit_open
+
+
+@pytest.mark.asyncio
+async def test_bridge_reports_time_to_recover():
+    config = SimulatorConfig(devices=2, rooms=1, comps=1, rsa_bits=1024)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge = Bridge(simulator.ip_address, "secret")
+        events = []
+        bridge.connection_events.subscribe(events.append)
+
+        run_task = asyncio.create_task(bridge.run())
+        await asyncio.wait_for(bridge.get_devices(), 10)
+
+        for client in list(simulator._clients):
+            await client.close()
+
+        for _ in range(100):
+            if sum(e.status == ConnectionStatus.Connected for e in events) == 2:
+                break
+            await asyncio.sleep(0.02)
+
+        await bridge.close()
+        await run_task
+
+    statuses = [e.status for e in events]
+    assert ConnectionStatus.Disconnected in statuses
+    assert events[-1].status == ConnectionStatus.Closed
+
+    recovered = [e for e in events if e.status == ConnectionStatus.Connected][-1]
+    assert recovered.time_to_recover is not None
@@ -0,0 +1,72 @@
+import pytest
+from xcomfort.room import Room, RctMode, RctState, RctModeRange
+
+
+class FakeBridge:
+    def __init__(self, raw_payload_keys=(), optimistic=False):
+        self.raw_payload_keys = raw_payload_keys
+        self.optimistic = optimistic
+        self.rctsetpointallowedvalues = {RctMode.Comfort: RctModeRange(18.0, 40.0)}
+        self.error = None
+
+    async def send_message(self, message_type, message):
+        if self.error is not None:
+            raise self.error
+
+
+def test_partial_updates_keep_previous_fields():
+    room = Room(FakeBridge(), 1, "")
+
+    room.handle_state({"roomId": 1, "currentMode": 2, "state": 1, "setpoint": 21.0, "temp": 19.5})
+    room.handle_state({"roomId": 1, "temp": 20.0})
+
+    state = room.state.value
+    assert state.mode == RctMode.Eco
+    assert state.rctstate == RctState.Auto
+    assert state.setpoint == 21.0
+    assert state.temperature == 20.0
+    assert state.raw is None
+
+
+def test_state_is_immutable():
+    room = Room(FakeBridge(), 1, "")
+    room.handle_state({"roomId": 1, "mode": 1, "state": 0})
+
+    with pytest.raises(AttributeError):
+        room.state.value.setpoint = 30.0
+
+    assert not hasattr(room.state.value, "__dict__")
+
+
+def test_raw_retention_limited_to_selected_keys():
+    room = Room(FakeBridge(raw_payload_keys=("temp", "valve")), 1, "")
+
+    room.handle_state({"roomId": 1, "mode": 1, "state": 0, "temp": 19.0, "name": "x"})
+    room.handle_state({"roomId": 1, "temp": 19.5, "valve": 40})
+
+    assert room.state.value.raw == {"temp": 19.5, "valve": 40}
+
+
+@pytest.mark.asyncio
+async def test_optimistic_setpoint_rolls_back_on_error():
+    bridge = FakeBridge(optimistic=True)
+    room = Room(bridge, 1, "")
+    room.handle_state({"roomId": 1, "mode": 3, "state": 0, "setpoint": 21.0})
+    confirmed = room.state.value
+    setpoints = []
+    room.state.subscribe(lambda state: setpoints.append((state.setpoint, state.pending)))
+
+    bridge.error = Exception("nack")
+    with pytest.raises(Exception):
+        await room.set_target_temperature(23.0)
+
+    assert setpoints == [(21.0, False), (23.0, True), (21.0, False)]
+    assert room.state.value is confirmed
+
+    bridge.error = None
+    await room.set_target_temperature(24.0)
+    assert room.state.value.pending
+
+    # A partial update confirms, carrying fields from the confirmed state
+    room.handle_state({"roomId": 1, "temp": 20.0, "setpoint": 24.0})
+    assert (room.state.value.setpoint, room.state.value.pending) == (24.0, False)
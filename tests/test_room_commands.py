@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from mock import Mock
+from xcomfort.bridge import Bridge
+from xcomfort.devices import Light, Shade, RcTouch
+from xcomfort.room import Room
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+@pytest.mark.asyncio
+async def test_all_off_uses_one_frame_per_room():
+    config = SimulatorConfig(devices=12, rooms=3, comps=1, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge = Bridge(simulator.ip_address, "secret")
+        bridge.wait_for_ack = True
+        run_task = asyncio.create_task(bridge.run())
+        devices = await asyncio.wait_for(bridge.get_devices(), 10)
+        rooms = bridge._rooms
+
+        assert sorted(device_id for room in rooms.values() for device_id in room.device_ids) == sorted(devices)
+
+        results = await bridge.switch_devices(devices.values(), True)
+
+        assert len(results) == 3
+        assert simulator.stats.room_commands_received == 3
+        assert all(device["switch"] for device in simulator.devices.values())
+
+        # A partial selection only uses rooms that are fully covered
+        room = next(iter(rooms.values()))
+        other = next(device_id for device_id in devices if device_id not in room.device_ids)
+        await bridge.switch_devices(room.device_ids + [other], False)
+
+        assert simulator.stats.room_commands_received == 4
+        assert simulator.stats.commands_received == 5
+        await devices[other].wait_for_state(lambda state: not state.switch, timeout=5)
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_room_dimm_updates_members():
+    config = SimulatorConfig(devices=4, rooms=1, comps=1, dimmable_ratio=1.0, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge = Bridge(simulator.ip_address, "secret")
+        run_task = asyncio.create_task(bridge.run())
+        devices = await asyncio.wait_for(bridge.get_devices(), 10)
+
+        await bridge._rooms[1].dimm(40)
+
+        for device in devices.values():
+            await device.wait_for_state(lambda state: state.dimmvalue == 40, timeout=5)
+
+        await bridge.close()
+        await run_task
+
+
+def test_room_command_requires_every_switched_member():
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+    bridge._devices = {
+        1: Light(bridge, 1, "Ceiling", True),
+        2: Light(bridge, 2, "Wall", True),
+        3: Shade(bridge, 3, "Blind", 1, {}),
+        4: RcTouch(bridge, 4, "Thermostat", 1),
+    }
+    bridge._rooms = {1: Room(bridge, 1, "Living", [1, 2, 3, 4])}
+
+    # The shade would be switched too, so the lights need their own frames
+    assert bridge._plan_room_commands([1, 2]) == ([], [1, 2])
+
+    rooms, device_ids = bridge._plan_room_commands([1, 2, 3])
+    assert rooms == [bridge._rooms[1]] and device_ids == []
+
+    # A shade cannot be dimmed
+    assert bridge._plan_room_commands([1, 2, 3], dimming=True) == ([], [1, 2, 3])
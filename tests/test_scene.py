@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from mock import Mock
+from xcomfort.bridge import Bridge
+from xcomfort.messages import Messages
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+@pytest.mark.asyncio
+async def test_scene_activation_is_one_frame():
+    config = SimulatorConfig(devices=10, rooms=2, comps=1, scenes=3, dimmable_ratio=1.0, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge = Bridge(simulator.ip_address, "secret")
+        bridge.wait_for_ack = True
+        run_task = asyncio.create_task(bridge.run())
+        await asyncio.wait_for(bridge.wait_for_initialization(), 10)
+
+        scenes = await bridge.get_scenes()
+        assert sorted(scenes) == [1, 2, 3]
+        assert scenes[2].device_ids == list(range(1, 11))
+
+        await scenes[2].activate()
+
+        assert simulator.stats.scene_activations == 1
+        assert simulator.stats.commands_received == 1
+        for device in bridge._devices.values():
+            await device.wait_for_state(lambda state: state.dimmvalue == 33, timeout=5)
+
+        await bridge.close()
+        await run_task
+
+
+def test_live_scene_updates():
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+    changes = []
+    bridge.topology_changes.subscribe(lambda change: changes.append((change.action, change.kind)))
+
+    bridge._onMessage({"type_int": Messages.SET_SCENE.value, "payload": {"sceneId": 4, "name": "Movie", "devices": [1, 2]}})
+    scene = bridge._scenes[4]
+    bridge._onMessage({"type_int": Messages.SET_SCENE.value, "payload": {"sceneId": 4, "name": "Cinema", "devices": [{"deviceId": 3, "value": 10}]}})
+
+    assert bridge._scenes[4] is scene
+    assert scene.name == "Cinema"
+    assert scene.device_ids == [3]
+
+    bridge._onMessage({"type_int": Messages.SCENE_DELETED.value, "payload": {"sceneId": 4}})
+
+    assert bridge._scenes == {}
+    assert changes == [("added", "scene"), ("changed", "scene"), ("removed", "scene")]
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from xcomfort.connection import SecureBridgeConnection, SendPriority
+from xcomfort.messages import Messages, ShadeOperationState
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_str(self, msg):
+        self.sent.append(msg)
+
+    async def close(self):
+        pass
+
+
+class RecordingConnection(SecureBridgeConnection):
+    async def _write(self, data):
+        await self.websocket.send_str(data)
+
+
+@pytest.mark.asyncio
+async def test_writer_sends_acks_and_stop_before_bulk_traffic():
+    websocket = FakeWebsocket()
+    connection = RecordingConnection(websocket, b"k" * 32, b"i" * 16, "bridge")
+    connection._start_writer()
+
+    bulk = [asyncio.ensure_future(connection.send_message(Messages.ACTION_SLIDE_DEVICE, {"deviceId": i, "dimmvalue": 10}))
+            for i in range(5)]
+    stop = asyncio.ensure_future(connection.send_message(
+        Messages.SET_DEVICE_SHADING_STATE, {"deviceId": 9, "state": ShadeOperationState.STOP}))
+    await connection.send({"type_int": Messages.ACK, "ref": 1}, SendPriority.ACK, wait=False)
+
+    await asyncio.gather(*bulk, stop)
+
+    types = [m["type_int"] for m in websocket.sent]
+    assert types[:2] == [Messages.ACK, Messages.SET_DEVICE_SHADING_STATE]
+    assert connection.send_queue_stats.frames_written == 7
+    assert connection.send_queue_stats.max_depth >= 6
+
+    connection._stop_writer()
+
+
+@pytest.mark.asyncio
+async def test_priorities_do_not_reorder_frames_for_one_target():
+    websocket = FakeWebsocket()
+    connection = RecordingConnection(websocket, b"k" * 32, b"i" * 16, "bridge")
+    connection._start_writer()
+
+    await asyncio.gather(
+        connection.send_message(Messages.ACTION_SLIDE_DEVICE, {"deviceId": 5, "dimmvalue": 10}),
+        connection.send_message(Messages.ACTION_SLIDE_DEVICE, {"deviceId": 1, "dimmvalue": 50}),
+        connection.send_message(Messages.SET_DEVICE_SHADING_STATE, {"deviceId": 2, "state": ShadeOperationState.CLOSE}),
+        connection.send_message(Messages.ACTION_SWITCH_DEVICE, {"deviceId": 1, "switch": False}),
+        connection.send_message(Messages.SET_DEVICE_SHADING_STATE, {"deviceId": 2, "state": ShadeOperationState.STOP}))
+
+    sent = [(m["payload"]["deviceId"], m["type_int"]) for m in websocket.sent]
+    assert sent == [
+        (2, Messages.SET_DEVICE_SHADING_STATE),
+        (2, Messages.SET_DEVICE_SHADING_STATE),
+        (1, Messages.ACTION_SLIDE_DEVICE),
+        (1, Messages.ACTION_SWITCH_DEVICE),
+        (5, Messages.ACTION_SLIDE_DEVICE),
+    ]
+    assert [m["payload"]["state"] for m in websocket.sent[:2]] == [ShadeOperationState.CLOSE, ShadeOperationState.STOP]
+    assert connection.send_queue_stats.frames_written == 5
+    assert not connection._queued_targets
+
+    connection._stop_writer()
@@ -0,0 +1,18 @@
+from xcomfort.devices import Shade
+
+
+class FakeBridge:
+    _comps = {}
+
+
+def test_partial_update_publishes_new_state_instance():
+    shade = Shade(FakeBridge(), 1, "", 2, {})
+
+    shade.handle_state({"shPos": 10})
+    first = shade.state.value
+    shade.handle_state({"curstate": 1})
+
+    assert shade.state.value is not first
+    assert first.current_state is None
+    assert shade.state.value.position == 10
+    assert shade.state.value.current_state == 1
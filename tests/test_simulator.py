@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from xcomfort.bridge import Bridge
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+
+
+@pytest.mark.asyncio
+async def test_bridge_loads_simulated_topology():
+    config = SimulatorConfig(devices=50, rooms=5, comps=5, chunk_size=20, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge = Bridge(simulator.ip_address, "secret")
+        run_task = asyncio.create_task(bridge.run())
+
+        devices = await asyncio.wait_for(bridge.get_devices(), 10)
+        rooms = await bridge.get_rooms()
+
+        assert len(devices) == 50
+        assert len(rooms) == 5
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_bridge_switch_roundtrip():
+    config = SimulatorConfig(devices=3, rooms=1, comps=1, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge = Bridge(simulator.ip_address, "secret")
+        run_task = asyncio.create_task(bridge.run())
+
+        devices = await asyncio.wait_for(bridge.get_devices(), 10)
+        light = devices[1]
+
+        await light.switch(True)
+        await light.wait_for_state(lambda state: state.switch, timeout=5)
+
+        assert simulator.devices[1]["switch"] == True
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_large_frames_are_decoded_off_loop_in_order():
+    config = SimulatorConfig(devices=300, rooms=3, comps=3, chunk_size=100, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge = Bridge(simulator.ip_address, "secret")
+        bridge.offload_threshold = 4096
+        run_task = asyncio.create_task(bridge.run())
+
+        devices = await asyncio.wait_for(bridge.get_devices(), 10)
+
+        assert len(devices) == 300
+        assert bridge.connection.decode_stats.offloaded_frames == 3
+        assert bridge.connection.decode_stats.inline_frames > 0
+
+        await bridge.close()
+        await run_task
+
+
+@pytest.mark.asyncio
+async def test_latency_does_not_serialize_commands():
+    config = SimulatorConfig(devices=5, rooms=1, comps=1, rsa_bits=1024, seed=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        bridge = Bridge(simulator.ip_address, "secret")
+        run_task = asyncio.create_task(bridge.run())
+
+        devices = await asyncio.wait_for(bridge.get_devices(), 10)
+        lights = [devices[i] for i in range(1, 5)]
+
+        simulator.config.latency = 0.3
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        await asyncio.gather(*(light.switch(True) for light in lights))
+        await asyncio.gather(*(light.wait_for_state(lambda state: state.switch, timeout=5) for light in lights))
+
+        assert loop.time() - started < 0.9
+
+        await bridge.close()
+        await run_task
@@ -0,0 +1,76 @@
+import aiohttp
+import asyncio
+import pytest
+from xcomfort.connection import setup_secure_connection
+from xcomfort.messages import Messages
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+from xcomfort.tokens import MemoryTokenStore, FileTokenStore
+
+
+@pytest.mark.asyncio
+async def test_reconnect_resumes_stored_token():
+    store = MemoryTokenStore()
+
+    async with BridgeSimulator("secret", SimulatorConfig(devices=1, rsa_bits=1024)) as simulator:
+        async with aiohttp.ClientSession() as session:
+            first = await setup_secure_connection(session, simulator.ip_address, "secret", store)
+            await first.close()
+
+            second = await setup_secure_connection(session, simulator.ip_address, "secret", store)
+            await second.close()
+
+    assert first.resumed == False
+    assert second.resumed == True
+    assert simulator.stats.logins == 1
+
+
+@pytest.mark.asyncio
+async def test_rejected_token_falls_back_to_login():
+    store = MemoryTokenStore()
+
+    async with BridgeSimulator("secret", SimulatorConfig(devices=1, rsa_bits=1024)) as simulator:
+        store.save(simulator.device_id, "stale", 3600)
+
+        async with aiohttp.ClientSession() as session:
+            connection = await setup_secure_connection(session, simulator.ip_address, "secret", store)
+            await connection.close()
+
+    assert connection.resumed == False
+    assert store.load(simulator.device_id).token == connection.token
+
+
+def test_file_token_store_roundtrip(tmp_path):
+    path = tmp_path / "tokens.json"
+
+    FileTokenStore(str(path)).save("bridge", "abc", 3600)
+
+    stored = FileTokenStore(str(path)).load("bridge")
+    assert stored.token == "abc"
+    assert stored.is_valid()
+
+
+@pytest.mark.asyncio
+async def test_token_is_renewed_before_expiry_on_live_connection():
+    config = SimulatorConfig(devices=1, rsa_bits=1024, token_lifetime=1)
+
+    async with BridgeSimulator("secret", config) as simulator:
+        async with aiohttp.ClientSession() as session:
+            connection = await setup_secure_connection(session, simulator.ip_address, "secret")
+            first_token = connection.token
+            received = []
+            connection.messages.subscribe(received.append)
+
+            pump = asyncio.create_task(connection.pump())
+
+            for _ in range(100):
+                if connection.token_renewal.renewals > 0:
+                    break
+                await asyncio.sleep(0.02)
+
+            assert connection.token != first_token
+            assert connection.token_renewal.last_duration is not None
+            assert not pump.done()
+            assert all(m['type_int'] != Messages.AUTH_RENEW_TOKEN_RESPONSE for m in received)
+
+            await connection.close()
+            await pump
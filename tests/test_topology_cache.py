@@ -0,0 +1,80 @@
+import asyncio
+import copy
+import pytest
+from mock import Mock
+from xcomfort.bridge import Bridge, State
+from xcomfort.devices import Light
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+from xcomfort.topology_cache import TopologyCache
+
+
+def make_simulator():
+    return BridgeSimulator("", SimulatorConfig(devices=6, rooms=2, comps=2, chunk_size=4, seed=1))
+
+
+def download(bridge, simulator):
+    for chunk in simulator.all_data_chunks():
+        bridge._handle_SET_ALL_DATA(copy.deepcopy(chunk))
+
+
+@pytest.mark.asyncio
+async def test_cached_topology_and_states_available_before_connecting(tmp_path):
+    path = str(tmp_path / "topology.json")
+    simulator = make_simulator()
+
+    bridge = Bridge("127.0.0.1", "", session=Mock(), topology_cache=path)
+    download(bridge, simulator)
+    light_id = next(device_id for device_id, device in bridge._devices.items() if isinstance(device, Light))
+    bridge._handle_SET_STATE_INFO({"item": [{"deviceId": light_id, "switch": True, "dimmvalue": 42}]})
+    await bridge.close()
+
+    restarted = Bridge("127.0.0.1", "", session=Mock(), topology_cache=TopologyCache(path))
+
+    assert restarted.load_topology_cache()
+    devices = await asyncio.wait_for(restarted.get_devices(), 0.1)
+
+    assert devices.keys() == bridge._devices.keys()
+    assert restarted._rooms.keys() == bridge._rooms.keys()
+    assert devices[light_id].state.value.switch == True
+    assert devices[light_id].state.value.dimmvalue == 42
+    assert restarted.state != State.Ready
+
+
+@pytest.mark.asyncio
+async def test_live_download_reconciles_cached_topology(tmp_path):
+    path = str(tmp_path / "topology.json")
+    simulator = make_simulator()
+
+    download(Bridge("127.0.0.1", "", session=Mock(), topology_cache=path), simulator)
+
+    del simulator.devices[2]
+    simulator.devices[3]["name"] = "Renamed"
+    simulator.devices[7] = dict(simulator.devices[1], deviceId=7, name="New")
+
+    bridge = Bridge("127.0.0.1", "", session=Mock(), topology_cache=path)
+    bridge.load_topology_cache()
+    old_device = bridge._devices[3]
+
+    changes = []
+    bridge.topology_changes.subscribe(lambda change: changes.append((change.action, change.kind, change.entity)))
+    download(bridge, simulator)
+
+    summary = sorted((action, kind, entity.device_id) for action, kind, entity in changes)
+    assert summary == [("added", "device", 7), ("changed", "device", 3), ("removed", "device", 2)]
+    assert bridge._devices[3] is old_device
+    assert bridge._devices[3].name == "Renamed"
+    assert 2 not in bridge._devices
+
+    # The saved snapshot follows the live topology
+    assert sorted(p["deviceId"] for p in TopologyCache(path).load()["devices"]) == [1, 3, 4, 5, 6, 7]
+
+
+def test_missing_or_corrupt_cache_is_ignored(tmp_path):
+    path = tmp_path / "topology.json"
+    bridge = Bridge("127.0.0.1", "", session=Mock(), topology_cache=str(path))
+
+    assert not bridge.load_topology_cache()
+
+    path.write_text("{not json")
+    assert not bridge.load_topology_cache()
+    assert bridge._devices == {}
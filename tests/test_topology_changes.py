@@ -0,0 +1,72 @@
+from mock import Mock
+from xcomfort.bridge import Bridge
+from xcomfort.devices import Light, Shade
+from xcomfort.messages import Messages
+
+
+def make_bridge():
+    bridge = Bridge("127.0.0.1", "", session=Mock())
+    bridge.logger = Mock()
+
+    changes = []
+    bridge.topology_changes.subscribe(lambda change: changes.append((change.action, change.kind, change.entity)))
+
+    return bridge, changes
+
+
+def send(bridge, message_type, payload):
+    bridge._onMessage({"type_int": message_type.value, "payload": payload})
+
+
+def light_payload(device_id, name="Light"):
+    return {"deviceId": device_id, "name": name, "devType": 100, "compId": 1, "dimmable": True,
+            "switch": False, "dimmvalue": 0}
+
+
+def test_device_added_renamed_and_deleted():
+    bridge, changes = make_bridge()
+
+    send(bridge, Messages.ADD_DEVICE, light_payload(5))
+    light = bridge._devices[5]
+    assert isinstance(light, Light)
+    assert light.state.value.switch == False
+
+    send(bridge, Messages.SET_DEVICE_INFO, {"deviceId": 5, "name": "Kitchen"})
+    assert bridge._devices[5] is light
+    assert light.name == "Kitchen"
+
+    send(bridge, Messages.DEVICE_DELETED, {"deviceId": 5})
+    assert 5 not in bridge._devices
+
+    assert changes == [("added", "device", light), ("changed", "device", light), ("removed", "device", light)]
+    bridge.logger.assert_not_called()
+
+
+def test_device_type_change_replaces_entity():
+    bridge, changes = make_bridge()
+    send(bridge, Messages.ADD_DEVICE, light_payload(5))
+
+    send(bridge, Messages.SET_DEVICE_INFO, {"deviceId": 5, "devType": 102})
+
+    shade = bridge._devices[5]
+    assert isinstance(shade, Shade)
+    assert shade.name == "Light"
+    assert changes[-1] == ("changed", "device", shade)
+
+
+def test_rooms_and_comps():
+    bridge, changes = make_bridge()
+
+    send(bridge, Messages.ADD_COMP, {"compId": 3, "name": "Actuator", "compType": 1})
+    send(bridge, Messages.SET_COMP_INFO, {"compId": 3, "name": "Hall actuator"})
+    send(bridge, Messages.SET_ROOM_INFO, {"roomId": 2, "name": "Hall"})
+    send(bridge, Messages.ROOM_DELETED, {"roomId": 2})
+    send(bridge, Messages.COMP_DELETED, {"compId": 3})
+    send(bridge, Messages.FOUND_COMP, {"compId": 4, "name": "New", "compType": 1})
+
+    assert [(action, kind) for action, kind, _ in changes] == [
+        ("added", "comp"), ("changed", "comp"), ("added", "room"), ("removed", "room"),
+        ("removed", "comp"), ("found", "comp")]
+    assert changes[1][2].name == "Hall actuator"
+    assert bridge._comps == {}
+    assert bridge._rooms == {}
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from xcomfort.simulator import BridgeSimulator, SimulatorConfig
+from xcomfort.workers import ShardedBridgeGroup, _Worker
+
+
+async def _wait_until(predicate, timeout=20):
+    for _ in range(int(timeout / 0.05)):
+        if predicate():
+            return
+        await asyncio.sleep(0.05)
+
+    raise asyncio.TimeoutError()
+
+
+@pytest.mark.asyncio
+async def test_sharded_group_routes_state_and_commands():
+    config = SimulatorConfig(devices=4, rooms=1, comps=1, scenes=2, rsa_bits=1024, seed=2)
+
+    async with BridgeSimulator("a", config) as first, BridgeSimulator("b", config) as second:
+        group = ShardedBridgeGroup(processes=2, stagger=0)
+        group.add_bridge("north", first.ip_address, "a")
+        group.add_bridge("south", second.ip_address, "b")
+
+        run_task = asyncio.create_task(group.run())
+
+        await _wait_until(lambda: len(group.devices) == 8 and
+                          all(d.state.value is not None for d in group.devices.values()))
+
+        await _wait_until(lambda: len(group.scenes) == 4)
+        assert group.scenes[("north", 1)].class_name == "Scene"
+
+        light = group.devices[("south", 2)]
+        await light.switch(True)
+
+        await _wait_until(lambda: light.state.value.switch)
+        assert second.devices[2]["switch"] == True
+        assert first.devices[2]["switch"] == False
+
+        await group.scenes[("north", 1)].activate()
+        await _wait_until(lambda: first.stats.scene_activations == 1)
+        assert second.stats.scene_activations == 0
+
+        await group.close()
+        await asyncio.wait_for(run_task, 10)
+
+
+
+class _Pipe:
+    def __init__(self, group):
+        self.group = group
+
+    def send(self, batch):
+        for message in batch:
+            self.group._on_message(message)
+
+
+@pytest.mark.asyncio
+async def test_topology_messages_update_the_index():
+    group = ShardedBridgeGroup(processes=1)
+    worker = _Worker(_Pipe(group), [("north", "127.0.0.1", "", {})], 0)
+    bridge = worker.group.bridges["north"]
+    lamp_payload = {"deviceId": 3, "name": "Lamp", "devType": 101, "compId": 1, "dimmable": True,
+                    "switch": True, "dimmvalue": 40}
+
+    bridge._handle_FOUND_COMP({"compId": 7, "name": "New comp", "compType": 83})
+    bridge._handle_device_payload(lamp_payload)
+    worker._flush()
+
+    assert group.comps == {}
+    lamp = group.devices[("north", 3)]
+    assert lamp.dimmable and lamp.dev_type == 101
+    assert lamp.state.value.dimmvalue == 40
+
+    with pytest.raises(AttributeError):
+        lamp.unknown
+
+    bridge._handle_SET_DEVICE_INFO({"deviceId": 3, "name": "Desk lamp"})
+    worker._flush()
+    assert group.devices[("north", 3)] is lamp
+    assert lamp.name == "Desk lamp"
+
+    # Deleted and added again, the new entity still gets its state
+    bridge._handle_DEVICE_DELETED({"deviceId": 3})
+    bridge._handle_ADD_DEVICE(lamp_payload)
+    worker._flush()
+
+    assert group.devices[("north", 3)] is not lamp
+    assert group.devices[("north", 3)].state.value.switch
+
+    await worker.group.close()
@@ -1,2 +1,5 @@
 from .bridge import Bridge
 from .devices import Light
+from .tokens import MemoryTokenStore, FileTokenStore
+from .group import BridgeGroup
+from .topology_cache import TopologyCache
@@ -4,13 +4,41 @@ import asyncio
 import string
 import time
 import rx
+from contextlib import nullcontext
 import rx.operators as ops
 from enum import Enum
-from .connection import SecureBridgeConnection, setup_secure_connection
-from .messages import Messages
-from .devices import (BridgeDevice, Light, RcTouch, Heater, Shade)
+from .connection import SecureBridgeConnection, setup_secure_connection, _priority_for
+from .messages import Messages, ShadeOperationState
+from .devices import (BridgeDevice, Light, RcTouch, Heater, Shade, device_class_for)
 from .room import Room, RoomState, RctMode, RctState, RctModeRange
 from .comp import Comp, CompState
+from .scene import Scene
+from .index import TopologyIndex
+from .reconnect import ReconnectPolicy, ConnectionStatus, ConnectionEvent
+from .coalesce import CommandCoalescer
+from .ratelimit import AdaptiveRateLimiter, COMMAND_TYPES
+from .topology_cache import TopologyCache
+from .state import _MISSING
+
+
+_MESSAGE_NAMES = {message_type.value: message_type.name for message_type in Messages}
+
+# Payload keys describing an entity rather than its state. A difference in any
+# of them between downloads is reported as a "changed" topology change.
+_TOPOLOGY_KEYS = {
+    "device": ("name", "devType", "compId", "dimmable"),
+    "room": ("name", "devices"),
+    "comp": ("name", "compType"),
+    "scene": ("name", "devices"),
+}
+
+# Topology keys applied to the existing entity in place. Changes to any other
+# topology key recreate the entity.
+_ENTITY_ATTRIBUTES = {"name": "name", "devices": "device_ids"}
+
+# Room members a room switch leaves alone. Everything else in the room,
+# including actuators and shades of registered types, is driven by it.
+_NOT_ROOM_SWITCHED = (RcTouch, Heater)
 
 
 class State(Enum):
@@ -19,10 +47,50 @@ class State(Enum):
     Ready = 2
     Closing = 10
 
+class InitializationError(Exception):
+    pass
+
+class InitializationTimeoutError(InitializationError, asyncio.TimeoutError):
+    pass
+
+class TopologyChange:
+    def __init__(self, action: str, kind: str, entity):
+        self.action = action
+        self.kind = kind
+        self.entity = entity
+
+    def __str__(self):
+        return f"TopologyChange({self.action}, {self.kind}, {self.entity})"
+
+    __repr__ = __str__
+
+class TopologyProgress:
+    def __init__(self, chunk: int, devices: int, rooms: int, comps: int, last: bool, elapsed: float):
+        # chunk counts SET_ALL_DATA messages since the connection was set up,
+        # the entity counts are totals so far
+        self.chunk = chunk
+        self.devices = devices
+        self.rooms = rooms
+        self.comps = comps
+        self.last = last
+        self.elapsed = elapsed
+
+    def __str__(self):
+        return f"TopologyProgress(chunk={self.chunk}, devices={self.devices}, rooms={self.rooms}, comps={self.comps}, last={self.last}, elapsed={self.elapsed:.3f})"
+
+    __repr__ = __str__
+
 class Bridge:
-    def __init__(self, ip_address: str, authkey: str, session=None):
+    def __init__(self, ip_address: str, authkey: str, session=None, token_store=None, reconnect_policy=None,
+                 coalesce_window=0.1, rate_limiter=None, raw_payload_keys=(), topology_cache=None):
         self.ip_address = ip_address
         self.authkey = authkey
+        self.token_store = token_store
+        # A TopologyCache, or a path for one. The cached topology is loaded
+        # when run() starts and saved after each full download and on close.
+        if isinstance(topology_cache, str):
+            topology_cache = TopologyCache(topology_cache)
+        self.topology_cache = topology_cache
 
         if session is None:
             session = aiohttp.ClientSession()
@@ -42,53 +110,435 @@ class Bridge:
         self._comps = {}
         self._devices = {}
         self._rooms = {}
+        self._scenes = {}
         self.state = State.Uninitialized
         self.connection = None
         self.connection_subscription = None
+        self.reconnect_policy = reconnect_policy or ReconnectPolicy()
+        self.connection_events = rx.subject.Subject()
+        # When enabled, commands wait for the bridge's ACK and raise
+        # CommandNackError / CommandTimeoutError instead of fire-and-forget.
+        self.wait_for_ack = False
+        # Publish expected states as pending while commands are in flight,
+        # rolled back on NACK or timeout. Implies waiting for ACKs.
+        self.optimistic = False
+        # Seconds after the ACK to wait for the state update confirming an
+        # optimistic state before rolling it back
+        self.optimistic_timeout = 2.0
+        self.command_timeout = None
+        self.command_retries = None
+        self.coalescer = CommandCoalescer(self._send_now, coalesce_window)
+        # Pass rate_limiter=False to send commands unthrottled
+        self.rate_limiter = AdaptiveRateLimiter() if rate_limiter is None else (rate_limiter or None)
+        self.topology_changes = rx.subject.Subject()
+        # Subscribed first, so other observers already see it updated
+        self.index = TopologyIndex()
+        self.topology_changes.subscribe(self.index.on_change)
+        # Emits a TopologyProgress after each SET_ALL_DATA chunk. Entities are
+        # usable as soon as their chunk is ingested, see wait_for_device.
+        self.topology_progress = rx.subject.Subject()
+        # Seconds from connecting to the first device / the lastItem chunk,
+        # for the most recent topology download
+        self.time_to_first_device = None
+        self.time_to_ready = None
+        self._topology_chunks = 0
+        self._topology_started_at = None
+        self._topology_signatures = {}
+        self._seen_entities = set()
+        self._entity_payloads = {}
+        self._topology_cache_loaded = False
+        self.handshake_limiter = None
+        # Raw payloads kept on typed device/room states: () keeps none,
+        # None keeps everything, otherwise only the listed keys.
+        self.raw_payload_keys = raw_payload_keys
+        # Large SET_ALL_DATA frames are decoded off the event loop
+        self.offload_threshold = SecureBridgeConnection.offload_threshold
+        self.decode_executor = None
+        self.receive_queue_size = SecureBridgeConnection.receive_queue_size
+        self.overflow_policy = SecureBridgeConnection.overflow_policy
+        self._closing = None
+        # Set once the SET_ALL_DATA chunk with lastItem has been ingested, or
+        # when the bridge is closed before that happened. _initialized is
+        # also set by loading a cached topology.
+        self._initialized = asyncio.Event()
+        self._live_topology = asyncio.Event()
+        self._initialized_error = None
         self.logger = lambda x: None
+        self._handlers = self._build_dispatch_table()
 
     async def run(self):
         if self.state != State.Uninitialized:
             raise Exception("Run can only be called once at a time")
 
         self.state = State.Initializing
+        self._closing = asyncio.Event()
+
+        if not self._topology_cache_loaded:
+            self.load_topology_cache()
+
+        attempt = 0
+        disconnected_at = None
 
         while self.state != State.Closing:
+            error = None
+            attempt += 1
+            self._emit_connection_event(ConnectionStatus.Connecting, attempt)
+
             try:
-                #self.logger(f"Connecting...")
                 await self._connect()
+                self.reconnect_policy.connected()
+                self._reset_topology_progress()
+
+                time_to_recover = None
+                if disconnected_at is not None:
+                    time_to_recover = time.monotonic() - disconnected_at
+
+                self._emit_connection_event(ConnectionStatus.Connected, attempt, time_to_recover=time_to_recover)
+                attempt = 0
+                disconnected_at = None
+
                 await self.connection.pump()
 
             except Exception as e:
                 self.logger(f"Error: {repr(e)}")
-                await asyncio.sleep(5)
+                error = e
 
             if self.connection_subscription is not None:
                 self.connection_subscription.dispose()
 
+            if self.state == State.Closing:
+                break
+
+            if disconnected_at is None:
+                disconnected_at = time.monotonic()
+
+            self._emit_connection_event(ConnectionStatus.Disconnected, attempt, error)
+
+            delay = self.reconnect_policy.next_delay(error)
+            status = ConnectionStatus.CircuitOpen if self.reconnect_policy.circuit_open else ConnectionStatus.Waiting
+            self._emit_connection_event(status, attempt, error, delay)
+
+            try:
+                await asyncio.wait_for(self._closing.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+        self._emit_connection_event(ConnectionStatus.Closed)
         self.state = State.Uninitialized
 
+    def _reset_topology_progress(self):
+        self._topology_chunks = 0
+        self._topology_started_at = time.monotonic()
+        self.time_to_first_device = None
+        self.time_to_ready = None
+        self._seen_entities.clear()
+
+    def _emit_connection_event(self, status, attempt=0, error=None, delay=None, time_to_recover=None):
+        self.connection_events.on_next(ConnectionEvent(status, attempt, error, delay, time_to_recover))
+
     async def switch_device(self, device_id, message):
         payload = {"deviceId": device_id}
         payload.update(message)
-        await self.send_message(Messages.ACTION_SWITCH_DEVICE, payload)
+        return await self.send_message(Messages.ACTION_SWITCH_DEVICE, payload)
 
     async def slide_device(self, device_id, message):
         payload = {"deviceId": device_id}
         payload.update(message)
-        await self.send_message(Messages.ACTION_SLIDE_DEVICE, payload)
+        return await self.send_message(Messages.ACTION_SLIDE_DEVICE, payload)
+
+    async def switch_room(self, room_id, message):
+        payload = {"roomId": room_id}
+        payload.update(message)
+        return await self.send_message(Messages.ACTION_SWITCH_ROOM, payload)
+
+    async def slide_room(self, room_id, message):
+        payload = {"roomId": room_id}
+        payload.update(message)
+        return await self.send_message(Messages.ACTION_SLIDE_ROOM, payload)
+
+    def _plan_room_commands(self, device_ids, dimming=False):
+        # Picks rooms whose switched members are all in device_ids, largest
+        # first, and returns them with the devices still needing their own
+        # command. Rooms covering a single remaining device gain nothing and
+        # are skipped.
+        remaining = set(device_ids)
+        candidates = []
+
+        for room in self._rooms.values():
+            members = {device_id for device_id in room.device_ids
+                       if not isinstance(self._devices.get(device_id), _NOT_ROOM_SWITCHED)}
+
+            if len(members) < 2 or not members <= remaining:
+                continue
+
+            if dimming and not all(isinstance(self._devices.get(device_id), Light) and self._devices[device_id].dimmable
+                                   for device_id in members):
+                continue
+
+            candidates.append((room, members))
+
+        rooms = []
+
+        for room, members in sorted(candidates, key=lambda candidate: len(candidate[1]), reverse=True):
+            if len(members & remaining) < 2:
+                continue
+
+            rooms.append(room)
+            remaining -= members
+
+        return rooms, [device_id for device_id in device_ids if device_id in remaining]
+
+    async def switch_devices(self, devices, switch: bool):
+        # Switches devices (or device ids) with as few frames as possible by
+        # using room commands for rooms whose switched members are all included
+        device_ids = list(dict.fromkeys(getattr(device, "device_id", device) for device in devices))
+        rooms, device_ids = self._plan_room_commands(device_ids)
+
+        return await asyncio.gather(
+            *(self.switch_room(room.room_id, {"switch": switch}) for room in rooms),
+            *(self.switch_device(device_id, {"switch": switch}) for device_id in device_ids))
+
+    async def dimm_devices(self, devices, value: int):
+        value = max(0, min(99, value))
+        device_ids = list(dict.fromkeys(getattr(device, "device_id", device) for device in devices))
+        rooms, device_ids = self._plan_room_commands(device_ids, dimming=True)
+
+        return await asyncio.gather(
+            *(self.slide_room(room.room_id, {"dimmvalue": value}) for room in rooms),
+            *(self.slide_device(device_id, {"dimmvalue": value}) for device_id in device_ids))
+
+    async def activate_scene(self, scene_id):
+        return await self.send_message(Messages.ACTIVATE_SCENE, {"sceneId": scene_id})
+
+    def _coalesce_key(self, message_type, message):
+        if message_type == Messages.ACTION_SLIDE_DEVICE:
+            return (message_type, message.get("deviceId"))
+
+        if message_type == Messages.ACTION_SLIDE_ROOM:
+            return (message_type, message.get("roomId"))
+
+        if message_type == Messages.SET_HEATING_STATE:
+            return (message_type, message.get("roomId"))
+
+        if message_type == Messages.SET_DEVICE_SHADING_STATE and message.get("state") == ShadeOperationState.GO_TO:
+            return (message_type, message.get("deviceId"))
+
+        return None
+
+    async def send_message(self, message_type: Messages, message, wait_for_ack=None):
+        key = self._coalesce_key(message_type, message)
+
+        if key is not None:
+            return await self.coalescer.submit(key, message_type, message, wait_for_ack)
 
-    async def send_message(self, message_type: Messages, message):
-        await self.connection.send_message(message_type, message)
+        # Switch/stop must not be overtaken by a slide still held back. The
+        # held frame is sent first, but its ACK is not waited for.
+        if "deviceId" in message:
+            device_id = message["deviceId"]
+            await self.coalescer.flush((Messages.ACTION_SLIDE_DEVICE, device_id), wait_for_ack=False)
 
-    def _add_comp(self, comp):
+            if message_type == Messages.SET_DEVICE_SHADING_STATE and message.get("state") == ShadeOperationState.STOP:
+                self.coalescer.drop((Messages.SET_DEVICE_SHADING_STATE, device_id))
+            else:
+                await self.coalescer.flush((Messages.SET_DEVICE_SHADING_STATE, device_id), wait_for_ack=False)
+        elif message_type == Messages.ACTION_SWITCH_ROOM:
+            await self.coalescer.flush((Messages.ACTION_SLIDE_ROOM, message["roomId"]), wait_for_ack=False)
+
+        return await self._send_now(message_type, message, wait_for_ack)
+
+    async def _send_now(self, message_type, message, wait_for_ack=None):
+        if wait_for_ack is None:
+            wait_for_ack = self.wait_for_ack or self.optimistic
+
+        if self.rate_limiter is not None and message_type in COMMAND_TYPES:
+            await self.rate_limiter.acquire(_priority_for(message_type, message))
+
+        return await self.connection.send_message(
+            message_type, message, wait_for_ack, self.command_timeout, self.command_retries)
+
+    def _add_comp(self, comp, action="added"):
         self._comps[comp.comp_id] = comp
+        self.topology_changes.on_next(TopologyChange(action, "comp", comp))
+        self._link_component(comp.comp_id, comp)
+
+    def _link_component(self, comp_id, comp):
+        for device_id in self.index.lookup("device", "comp", comp_id):
+            device = self._devices.get(device_id)
+            if device is not None:
+                device.component = comp
 
-    def _add_device(self, device):
+    def _add_device(self, device, action="added"):
         self._devices[device.device_id] = device
+        self.topology_changes.on_next(TopologyChange(action, "device", device))
 
-    def _add_room(self, room):
+    def _add_room(self, room, action="added"):
         self._rooms[room.room_id] = room
+        self.topology_changes.on_next(TopologyChange(action, "room", room))
+
+    def _add_scene(self, scene, action="added"):
+        self._scenes[scene.scene_id] = scene
+        self.topology_changes.on_next(TopologyChange(action, "scene", scene))
+
+    def _remove_scene(self, scene_id):
+        scene = self._scenes.pop(scene_id, None)
+        self._forget_entity("scene", scene_id)
+
+        if scene is not None:
+            self.topology_changes.on_next(TopologyChange("removed", "scene", scene))
+
+    def _remove_comp(self, comp_id):
+        comp = self._comps.pop(comp_id, None)
+        self._forget_entity("comp", comp_id)
+
+        if comp is not None:
+            self.topology_changes.on_next(TopologyChange("removed", "comp", comp))
+            self._link_component(comp_id, None)
+
+    def _remove_device(self, device_id):
+        device = self._devices.pop(device_id, None)
+        self._forget_entity("device", device_id)
+
+        if device is not None:
+            self.topology_changes.on_next(TopologyChange("removed", "device", device))
+
+    def _remove_room(self, room_id):
+        room = self._rooms.pop(room_id, None)
+        self._forget_entity("room", room_id)
+
+        if room is not None:
+            self.topology_changes.on_next(TopologyChange("removed", "room", room))
+
+    def _forget_entity(self, kind, entity_id):
+        self._topology_signatures.pop((kind, entity_id), None)
+        self._entity_payloads.pop((kind, entity_id), None)
+        self._seen_entities.discard((kind, entity_id))
+
+    def _topology_changed(self, kind, entity_id, payload):
+        # Tracks which entities the current download has seen and whether
+        # their descriptive keys differ from what we knew before
+        key = (kind, entity_id)
+        self._seen_entities.add(key)
+
+        # Kept as a tuple in _TOPOLOGY_KEYS order, _MISSING for unknown keys
+        signature = self._topology_signatures.get(key)
+        values = []
+        changed = {}
+
+        for index, name in enumerate(_TOPOLOGY_KEYS[kind]):
+            old_value = _MISSING if signature is None else signature[index]
+
+            if name in payload:
+                value = payload[name]
+                if old_value is not _MISSING and old_value != value:
+                    changed[name] = value
+                values.append(value)
+            else:
+                values.append(old_value)
+
+        values = tuple(values)
+        if values != signature:
+            self._topology_signatures[key] = values
+
+        return changed
+
+    def _topology_payload(self, kind, entity_id, payload):
+        # Partial info messages only carry what changed, fill in the rest
+        signature = self._topology_signatures[(kind, entity_id)]
+        known = {name: value for name, value in zip(_TOPOLOGY_KEYS[kind], signature) if value is not _MISSING}
+
+        return {**known, **payload}
+
+    def _entity_table(self, kind):
+        if kind == "device":
+            return self._devices, self._create_device_from_payload, self._add_device
+        if kind == "room":
+            return self._rooms, self._create_room_from_payload, self._add_room
+        if kind == "scene":
+            return self._scenes, self._create_scene_from_payload, self._add_scene
+        return self._comps, self._create_comp_from_payload, self._add_comp
+
+    def _apply_topology(self, kind, entity_id, payload):
+        # Returns the entity for payload, creating it if needed. Renames are
+        # applied in place, other topology changes replace the entity.
+        entities, create, add = self._entity_table(kind)
+
+        entity = entities.get(entity_id)
+        changed = self._topology_changed(kind, entity_id, payload)
+
+        if entity is not None and not changed:
+            return entity
+
+        if entity is not None and changed.keys() <= _ENTITY_ATTRIBUTES.keys():
+            for name, value in changed.items():
+                setattr(entity, _ENTITY_ATTRIBUTES[name], value)
+
+            self.topology_changes.on_next(TopologyChange("changed", kind, entity))
+            return entity
+
+        new_entity = create(payload if entity is None else self._topology_payload(kind, entity_id, payload))
+
+        if new_entity is not None:
+            add(new_entity, "added" if entity is None else "changed")
+
+        return new_entity
+
+    def _remember_payload(self, kind, entity_id, payload):
+        if self.topology_cache is None:
+            return
+
+        key = (kind, entity_id)
+        previous = self._entity_payloads.get(key)
+        self._entity_payloads[key] = payload if previous is None else {**previous, **payload}
+
+    def _remove_unseen_entities(self):
+        for kind, entities, remove in (("device", self._devices, self._remove_device),
+                                       ("room", self._rooms, self._remove_room),
+                                       ("comp", self._comps, self._remove_comp),
+                                       ("scene", self._scenes, self._remove_scene)):
+            for entity_id in [entity_id for entity_id in entities if (kind, entity_id) not in self._seen_entities]:
+                remove(entity_id)
+
+    def load_topology_cache(self):
+        # Populates devices, rooms, comps and scenes from the cache, marking the
+        # bridge initialized. Returns False when there is nothing to load.
+        self._topology_cache_loaded = True
+
+        if self.topology_cache is None:
+            return False
+
+        snapshot = self.topology_cache.load()
+
+        if not snapshot or not snapshot["devices"]:
+            return False
+
+        for kind, handle in (("comps", self._handle_comp_payload),
+                             ("rooms", self._handle_room_payload),
+                             ("devices", self._handle_device_payload),
+                             ("scenes", self._handle_scene_payload)):
+            for payload in snapshot[kind]:
+                try:
+                    handle(payload)
+                except Exception as e:
+                    self.logger(f"Failed to load cached {kind} payload: {str(e)}")
+
+        # Cached entities have to be confirmed by the next download
+        self._seen_entities.clear()
+        self._initialized.set()
+
+        return True
+
+    def save_topology_cache(self):
+        if self.topology_cache is None:
+            return
+
+        payloads = {"device": [], "room": [], "comp": [], "scene": []}
+        for (kind, _), payload in self._entity_payloads.items():
+            payloads[kind].append(payload)
+
+        try:
+            self.topology_cache.save(payloads["comp"], payloads["room"], payloads["device"], payloads["scene"])
+        except Exception as e:
+            self.logger(f"Failed to save topology cache: {repr(e)}")
 
     def _handle_SET_DEVICE_STATE(self, payload):
         try:
@@ -98,22 +548,27 @@ class Bridge:
         except KeyError:
             return
 
+        self._remember_payload("device", device.device_id, payload)
+
     def _handle_SET_STATE_INFO(self, payload):
         for item in payload['item']:
             if 'deviceId' in item:
                 deviceId = item['deviceId']
                 device = self._devices[deviceId]
                 device.handle_state(item)
+                self._remember_payload("device", deviceId, item)
 
             elif 'roomId' in item:
                 roomId = item['roomId']
                 room = self._rooms[roomId]
                 room.handle_state(item)
+                self._remember_payload("room", roomId, item)
 
             elif 'compId' in item:
                 compId = item['compId']
                 comp = self._comps[compId]
                 comp.handle_state(item)
+                self._remember_payload("comp", compId, item)
 
             else:
                 self.logger(f"Unknown state info: {payload}")
@@ -126,88 +581,117 @@ class Bridge:
         return Comp(self, comp_id, comp_type, name, payload)
 
     def _create_device_from_payload(self, payload):
-        device_id = payload['deviceId']
-        name = payload['name']
         dev_type = payload["devType"]
         comp_id = payload["compId"]
+        component = self._comps.get(comp_id)
 
-        if dev_type == 100 or dev_type == 101:
-            dimmable = payload['dimmable']
-            return Light(self, device_id, name, dimmable)
+        device_class = device_class_for(dev_type, component.comp_type if component is not None else None)
+        device = device_class.from_payload(self, payload)
 
-        if dev_type == 102:
-            return Shade(self, device_id, name, comp_id, payload)
+        device.dev_type = dev_type
+        device.comp_id = comp_id
+        device.component = component
 
-        if dev_type == 440:
-            return Heater(self, device_id, name, comp_id)
-
-        if dev_type == 450:
-            return RcTouch(self, device_id, name, comp_id)
-
-        return BridgeDevice(self, device_id, name)
+        return device
 
     def _create_room_from_payload(self, payload):
         room_id = payload['roomId']
         name = payload['name']
 
-        return Room(self, room_id, name)
+        return Room(self, room_id, name, payload.get('devices', ()))
+
+    def _create_scene_from_payload(self, payload):
+        scene_id = payload['sceneId']
+        name = payload['name']
+
+        return Scene(self, scene_id, name, payload.get('devices', ()))
+
+    def _handle_scene_payload(self, payload):
+        scene_id = payload['sceneId']
+
+        if self._apply_topology("scene", scene_id, payload) is not None:
+            self._remember_payload("scene", scene_id, payload)
 
     def _handle_comp_payload(self, payload):
         comp_id = payload['compId']
 
-        comp = self._comps.get(comp_id)
+        comp = self._apply_topology("comp", comp_id, payload)
 
         if comp is None:
-            comp = self._create_comp_from_payload(payload)
-
-            if comp is None:
-                return
-
-            self._add_comp(comp)
+            return
 
         comp.handle_state(payload)
+        self._remember_payload("comp", comp_id, payload)
 
     def _handle_device_payload(self, payload):
         device_id = payload['deviceId']
 
-        device = self._devices.get(device_id)
+        device = self._apply_topology("device", device_id, payload)
 
         if device is None:
-            device = self._create_device_from_payload(payload)
-
-            if device is None:
-                return
-
-            self._add_device(device)
+            return
 
         device.handle_state(payload)
+        self._remember_payload("device", device_id, payload)
 
     def _handle_room_payload(self, payload):
         room_id = payload['roomId']
 
-        room = self._rooms.get(room_id)
+        room = self._apply_topology("room", room_id, payload)
 
         if room is None:
-            room = self._create_room_from_payload(payload)
+            return
 
-            if room is None:
-                return
+        room.handle_state(payload)
+        self._remember_payload("room", room_id, payload)
 
-            self._add_room(room)
+    def _handle_ADD_DEVICE(self, payload):
+        self._handle_device_payload(payload)
 
-        room.handle_state(payload)
+    def _handle_SET_DEVICE_INFO(self, payload):
+        device_id = payload['deviceId']
+        self._apply_topology("device", device_id, payload)
+        self._remember_payload("device", device_id, payload)
 
-    def _handle_SET_ALL_DATA(self, payload):
-        if 'lastItem' in payload:
-            self.state = State.Ready
+    def _handle_DEVICE_DELETED(self, payload):
+        self._remove_device(payload['deviceId'])
 
-        if 'devices' in payload:
-            for device_payload in payload['devices']:
-                try:
-                    self._handle_device_payload(device_payload)
-                except Exception as e:
-                    self.logger(f"Failed to handle device payload: {str(e)}")
+    def _handle_SET_ROOM_INFO(self, payload):
+        room_id = payload['roomId']
+        self._apply_topology("room", room_id, payload)
+        self._remember_payload("room", room_id, payload)
+
+    def _handle_ROOM_DELETED(self, payload):
+        self._remove_room(payload['roomId'])
+
+    def _handle_ADD_COMP(self, payload):
+        self._handle_comp_payload(payload)
+
+    def _handle_SET_COMP_INFO(self, payload):
+        comp_id = payload['compId']
+        self._apply_topology("comp", comp_id, payload)
+        self._remember_payload("comp", comp_id, payload)
+
+    def _handle_COMP_DELETED(self, payload):
+        self._remove_comp(payload['compId'])
 
+    def _handle_SET_SCENE(self, payload):
+        self._handle_scene_payload(payload)
+
+    def _handle_SCENE_DELETED(self, payload):
+        self._remove_scene(payload['sceneId'])
+
+    def _handle_FOUND_COMP(self, payload):
+        # A component discovered while learning, not yet part of the home.
+        # It is reported but only added once ADD_COMP arrives.
+        comp = self._create_comp_from_payload(payload)
+        self.topology_changes.on_next(TopologyChange("found", "comp", comp))
+
+    def _handle_SET_ALL_DATA(self, payload):
+        if self._topology_started_at is None:
+            self._reset_topology_progress()
+
+        # Comps first, so devices can fall back to their component's type
         if 'comps' in payload:
             for comp_payload in payload["comps"]:
                 try:
@@ -215,6 +699,13 @@ class Bridge:
                 except Exception as e:
                     self.logger(f"Failed to handle comp payload: {str(e)}")
 
+        if 'devices' in payload:
+            for device_payload in payload['devices']:
+                try:
+                    self._handle_device_payload(device_payload)
+                except Exception as e:
+                    self.logger(f"Failed to handle device payload: {str(e)}")
+
         if 'rooms' in payload:
             for room_payload in payload["rooms"]:
                 try:
@@ -222,6 +713,13 @@ class Bridge:
                 except Exception as e:
                     self.logger(f"Failed to handle room payload: {str(e)}")
 
+        if 'scenes' in payload:
+            for scene_payload in payload["scenes"]:
+                try:
+                    self._handle_scene_payload(scene_payload)
+                except Exception as e:
+                    self.logger(f"Failed to handle scene payload: {str(e)}")
+
         if 'roomHeating' in payload:
             for room_payload in payload["roomHeating"]:
                 try:
@@ -229,49 +727,220 @@ class Bridge:
                 except Exception as e:
                     self.logger(f"Failed to handle room payload: {str(e)}")
 
+        self._topology_chunks += 1
+        elapsed = time.monotonic() - self._topology_started_at
+        last = 'lastItem' in payload
+
+        if self.time_to_first_device is None and self._devices:
+            self.time_to_first_device = elapsed
+
+        if last:
+            self.time_to_ready = elapsed
+
+        self.topology_progress.on_next(TopologyProgress(
+            self._topology_chunks, len(self._devices), len(self._rooms), len(self._comps), last, elapsed))
+
+        if last:
+            self._remove_unseen_entities()
+            self._seen_entities.clear()
+            self.state = State.Ready
+            self._initialized.set()
+            self._live_topology.set()
+            self.save_topology_cache()
+
     def _handle_UNKNOWN(self, message_type, payload):
-        self.logger(f"Unhandled package [{message_type.name}]: {payload}")
-        pass
+        name = _MESSAGE_NAMES.get(message_type, message_type)
+        self.logger(f"Unhandled package [{name}]: {payload}")
+
+    def _build_dispatch_table(self):
+        handlers = {}
+
+        for message_type in Messages:
+            method = getattr(self, '_handle_' + message_type.name, None)
+
+            if method is not None:
+                handlers[message_type.value] = method
+
+        return handlers
+
+    def register_handler(self, message_type, handler):
+        # handler(payload) replaces the built-in handling for message_type.
+        # The previous handler is returned so it can be chained or restored.
+        message_type = int(message_type)
+        previous = self._handlers.get(message_type)
+        self._handlers[message_type] = handler
+
+        return previous
+
+    def unregister_handler(self, message_type):
+        message_type = int(message_type)
+        self._handlers.pop(message_type, None)
+
+        default = self._build_dispatch_table().get(message_type)
+        if default is not None:
+            self._handlers[message_type] = default
 
     def _onMessage(self, message):
 
         if 'payload' in message:
             # self.logger(f"Message: {message}")
-            message_type = Messages(message['type_int'])
-            method_name = '_handle_' + message_type.name
+            message_type = message['type_int']
+            handler = self._handlers.get(message_type)
+
+            if handler is None:
+                self._handle_UNKNOWN(message_type, message['payload'])
+                return
 
-            method = getattr(self, method_name,
-                             lambda p: self._handle_UNKNOWN(message_type, p))
             try:
-                method(message['payload'])
+                handler(message['payload'])
             except Exception as e:
-                self.logger(f"Unknown error with: {method_name}: {str(e)}")
+                name = _MESSAGE_NAMES.get(message_type, message_type)
+                self.logger(f"Unknown error with: _handle_{name}: {str(e)}")
         else:
             self.logger(f"Not known: {message}")
 
     async def _connect(self):
-        self.connection = await setup_secure_connection(self._session, self.ip_address, self.authkey)
+        async with self.handshake_limiter or nullcontext():
+            self.connection = await setup_secure_connection(
+                self._session, self.ip_address, self.authkey, self.token_store)
+
+        self.connection.rate_limiter = self.rate_limiter
+        self.connection.offload_threshold = self.offload_threshold
+        self.connection.decode_executor = self.decode_executor
+        self.connection.receive_queue_size = self.receive_queue_size
+        self.connection.overflow_policy = self.overflow_policy
         self.connection_subscription = self.connection.messages.subscribe(
             self._onMessage)
 
-    async def close(self):
+    async def close(self, drain=False):
         self.state = State.Closing
 
+        if self._closing is not None:
+            self._closing.set()
+
+        if not self._live_topology.is_set():
+            if not self._initialized.is_set():
+                self._initialized_error = "Bridge was closed before initialization completed"
+                self._initialized.set()
+            self._live_topology.set()
+        else:
+            self.save_topology_cache()
+
         if isinstance(self.connection, SecureBridgeConnection):
+            try:
+                await self.coalescer.flush_all()
+            except Exception as e:
+                self.logger(f"Failed to flush pending commands: {repr(e)}")
+
             self.connection_subscription.dispose()
-            await self.connection.close()
+            await self.connection.close(drain)
 
         if self._closeSession:
             await self._session.close()
 
-    async def wait_for_initialization(self):
-        if self.state == State.Uninitialized:
-            await asyncio.sleep(0.1)
+    async def wait_for_initialization(self, timeout: float | None = None):
+        try:
+            await asyncio.wait_for(self._initialized.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise InitializationTimeoutError(
+                f"Bridge {self.ip_address} not initialized after {timeout}s "
+                f"(state={self.state.name}, devices={len(self._devices)}, rooms={len(self._rooms)})") from None
+
+        if self._initialized_error is not None:
+            raise InitializationError(self._initialized_error)
+
+    async def wait_for_device(self, device_id, timeout: float | None = None):
+        # Resolves as soon as the chunk containing the device is ingested,
+        # without waiting for the rest of the topology
+        device = self._devices.get(device_id)
+        if device is not None:
+            return device
+
+        future = asyncio.get_event_loop().create_future()
+
+        def on_change(change):
+            if change.action == "added" and change.kind == "device" \
+                    and change.entity.device_id == device_id and not future.done():
+                future.set_result(change.entity)
+
+        subscription = self.topology_changes.subscribe(on_change)
+        initialized = asyncio.ensure_future(self._live_topology.wait())
+
+        try:
+            done, _ = await asyncio.wait((future, initialized), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            subscription.dispose()
+            initialized.cancel()
+
+        if future.done():
+            return future.result()
+
+        if initialized in done:
+            if self.state != State.Ready:
+                raise InitializationError(self._initialized_error or "Bridge was closed before the topology was downloaded")
+            raise KeyError(f"Device {device_id} is not known to bridge {self.ip_address}")
+
+        raise asyncio.TimeoutError(f"Device {device_id} not seen after {timeout}s")
+
+    async def wait_for_state(self, device_id, predicate=None, timeout: float | None = None):
+        # Waits for the device, then for a state matching predicate. The
+        # timeout covers both.
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        device = await self.wait_for_device(device_id, timeout)
+        remaining = None if deadline is None else max(0, deadline - loop.time())
+
+        return await device.wait_for_state(predicate, remaining)
+
+    def _resolve(self, entities, ids):
+        return [entities[entity_id] for entity_id in ids if entity_id in entities]
+
+    def find_devices(self, room_id=None, comp_id=None, dev_type=None, name=None, device_class=None):
+        # Devices matching all given criteria, using the indexes instead of
+        # scanning every device
+        candidates = None
 
-        while self.state == State.Initializing:
-            await asyncio.sleep(0.1)
+        for index_name, value in (("room", room_id), ("comp", comp_id), ("type", dev_type), ("name", name)):
+            if value is None:
+                continue
 
-        return
+            ids = self.index.lookup("device", index_name, value)
+            candidates = set(ids) if candidates is None else candidates & ids
+
+            if not candidates:
+                return []
+
+        devices = list(self._devices.values()) if candidates is None else self._resolve(self._devices, candidates)
+
+        if device_class is not None:
+            devices = [device for device in devices if isinstance(device, device_class)]
+
+        return devices
+
+    def find_rooms(self, device_id=None, name=None):
+        if device_id is not None and name is not None:
+            ids = self.index.lookup("room", "device", device_id) & self.index.lookup("room", "name", name)
+        elif device_id is not None:
+            ids = self.index.lookup("room", "device", device_id)
+        elif name is not None:
+            ids = self.index.lookup("room", "name", name)
+        else:
+            return list(self._rooms.values())
+
+        return self._resolve(self._rooms, ids)
+
+    def find_comps(self, comp_type=None, name=None):
+        if comp_type is not None and name is not None:
+            ids = self.index.lookup("comp", "type", comp_type) & self.index.lookup("comp", "name", name)
+        elif comp_type is not None:
+            ids = self.index.lookup("comp", "type", comp_type)
+        elif name is not None:
+            ids = self.index.lookup("comp", "name", name)
+        else:
+            return list(self._comps.values())
+
+        return self._resolve(self._comps, ids)
 
     async def get_comps(self):
         await self.wait_for_initialization()
@@ -287,3 +956,8 @@ class Bridge:
         await self.wait_for_initialization()
 
         return self._rooms
+
+    async def get_scenes(self):
+        await self.wait_for_initialization()
+
+        return self._scenes
@@ -0,0 +1,99 @@
+import asyncio
+
+
+class _PendingCommand:
+    def __init__(self, message_type, payload, wait_for_ack):
+        self.message_type = message_type
+        self.payload = payload
+        self.wait_for_ack = wait_for_ack
+        self.futures = []
+        self.handle = None
+
+
+class CommandCoalescer:
+    # Throttles commands per key: the first command in a window goes out
+    # immediately, later ones replace each other and only the newest is sent
+    # when the window ends. Callers of replaced commands get the result of
+    # the frame that superseded them.
+    def __init__(self, send, window: float = 0.1):
+        self._send = send
+        self.window = window
+        self.frames_sent = 0
+        self.frames_saved = 0
+        self._pending = {}
+        self._last_sent = {}
+
+    async def submit(self, key, message_type, payload, wait_for_ack=None):
+        loop = asyncio.get_event_loop()
+        pending = self._pending.get(key)
+
+        if pending is not None:
+            pending.message_type = message_type
+            pending.payload = payload
+            pending.wait_for_ack = wait_for_ack
+            self.frames_saved += 1
+        else:
+            now = loop.time()
+            last = self._last_sent.get(key)
+
+            if self.window <= 0 or last is None or now - last >= self.window:
+                self._last_sent[key] = now
+                self.frames_sent += 1
+                return await self._send(message_type, payload, wait_for_ack)
+
+            pending = _PendingCommand(message_type, payload, wait_for_ack)
+            pending.handle = loop.call_at(last + self.window, self._on_window_end, key)
+            self._pending[key] = pending
+
+        future = loop.create_future()
+        pending.futures.append(future)
+
+        return await future
+
+    def _on_window_end(self, key):
+        asyncio.ensure_future(self.flush(key))
+
+    async def flush(self, key, wait_for_ack=None):
+        # wait_for_ack=False sends the held command without waiting for its
+        # ACK, for when another command has to follow it right away
+        pending = self._pending.pop(key, None)
+
+        if pending is None:
+            return
+
+        pending.handle.cancel()
+        self._last_sent[key] = asyncio.get_event_loop().time()
+        self.frames_sent += 1
+
+        if wait_for_ack is None:
+            wait_for_ack = pending.wait_for_ack
+
+        try:
+            result = await self._send(pending.message_type, pending.payload, wait_for_ack)
+        except Exception as e:
+            for future in pending.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future in pending.futures:
+                if not future.done():
+                    future.set_result(result)
+
+    def drop(self, key):
+        # Discards the held command, e.g. a shade GO_TO made pointless by a
+        # STOP. Its callers get None.
+        pending = self._pending.pop(key, None)
+
+        if pending is None:
+            return
+
+        pending.handle.cancel()
+        self.frames_saved += 1
+
+        for future in pending.futures:
+            if not future.done():
+                future.set_result(None)
+
+    async def flush_all(self):
+        for key in list(self._pending):
+            await self.flush(key)
@@ -0,0 +1,115 @@
+import json
+from binascii import a2b_base64, b2a_base64
+from Crypto.Cipher import AES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonBackend:
+    def __init__(self, name, loads, dumps, accepts_memoryview=False):
+        self.name = name
+        # loads accepts bytes, dumps returns bytes
+        self.loads = loads
+        self.dumps = dumps
+        self.accepts_memoryview = accepts_memoryview
+
+    def __str__(self):
+        return f"JsonBackend({self.name})"
+
+    __repr__ = __str__
+
+
+def _stdlib_backend():
+    return JsonBackend("json", json.loads, lambda data: json.dumps(data).encode())
+
+
+def json_backend(name: str = None) -> JsonBackend:
+    if name is None:
+        name = "orjson" if orjson is not None else "ujson" if ujson is not None else "json"
+
+    if name == "orjson":
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+        return JsonBackend("orjson", orjson.loads, orjson.dumps, accepts_memoryview=True)
+
+    if name == "ujson":
+        if ujson is None:
+            raise ImportError("ujson is not installed")
+        return JsonBackend("ujson", ujson.loads, lambda data: ujson.dumps(data).encode())
+
+    if name == "json":
+        return _stdlib_backend()
+
+    raise ValueError(f"Unknown JSON backend: {name}")
+
+
+class FrameCodec:
+    # Up to this size, CBC decryption is done as one ECB pass over the reused
+    # key schedule followed by a single XOR with the shifted ciphertext. For
+    # larger frames a fresh CBC cipher is faster than the big-int XOR.
+    ecb_max_size = 2048
+
+    def __init__(self, key: bytes, iv: bytes, backend: JsonBackend = None):
+        self.key = key
+        self.iv = iv
+        self.json = backend or json_backend()
+        self._ecb = AES.new(key, AES.MODE_ECB)
+
+    def offload_args(self):
+        # Arguments for decode_frame, which can run in a thread or process pool
+        return (self.key, self.iv, self.json.name)
+
+    def _decrypt(self, ct: bytes) -> bytes:
+        if len(ct) > self.ecb_max_size:
+            return AES.new(self.key, AES.MODE_CBC, self.iv).decrypt(ct)
+
+        data = self._ecb.decrypt(ct)
+        chain = int.from_bytes(self.iv, "little") | int.from_bytes(ct[:-AES.block_size], "little") << 128
+
+        return (int.from_bytes(data, "little") ^ chain).to_bytes(len(data), "little")
+
+    def decode(self, frame: str) -> dict:
+        # a2b_base64 skips the trailing \u0004 terminator
+        data = self._decrypt(a2b_base64(frame))
+
+        end = len(data)
+        while end and data[end - 1] == 0:
+            end -= 1
+
+        if not end:
+            return {}
+
+        if end < len(data):
+            data = memoryview(data)[:end] if self.json.accepts_memoryview else data[:end]
+
+        return self.json.loads(data)
+
+    def encode(self, message: dict) -> str:
+        data = self.json.dumps(message)
+        data += b'\x00' * (AES.block_size - len(data) % AES.block_size)
+        data = AES.new(self.key, AES.MODE_CBC, self.iv).encrypt(data)
+
+        return b2a_base64(data, newline=False).decode("ascii") + '\u0004'
+
+
+_codec_cache = {}
+
+
+def decode_frame(key: bytes, iv: bytes, backend_name: str, frame: str) -> dict:
+    codec = _codec_cache.get((key, iv, backend_name))
+
+    if codec is None:
+        if len(_codec_cache) > 64:
+            _codec_cache.clear()
+
+        codec = _codec_cache[(key, iv, backend_name)] = FrameCodec(key, iv, json_backend(backend_name))
+
+    return codec.decode(frame)
@@ -1,15 +1,18 @@
-import rx
+from .state import StatePublisher, FrozenState
+
+class CompState(FrozenState):
+    __slots__ = ('raw',)
+    _fields = ('raw',)
 
-class CompState:
     def __init__(self, raw):
-        self.raw = raw
+        FrozenState.__init__(self, raw=raw)
 
     def __str__(self):
         return f"CompState({self.raw})"
 
     __repr__ = __str__
 
-class Comp:
+class Comp(StatePublisher):
     def __init__(self, bridge, comp_id, comp_type, name: str, payload: dict):
         self.bridge = bridge
         self.comp_id = comp_id
@@ -17,10 +20,10 @@ class Comp:
         self.name = name
         self.payload = payload
 
-        self.state = rx.subject.BehaviorSubject(None)
+        self._init_state()
 
     def handle_state(self, payload):
-        self.state.on_next(CompState(payload))
+        self._publish_state(CompState(payload))
 
     def __str__(self):
         return f'Comp({self.comp_id}, "{self.name}", comp_type: {self.comp_type}, payload: {self.payload})'
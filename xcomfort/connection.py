@@ -1,21 +1,125 @@
 import aiohttp
 import asyncio
+import heapq
 import json
 import string
 import secrets
 import time
 import rx
 from enum import IntEnum
-from .messages import Messages
+from .messages import Messages, ShadeOperationState
+from .ratelimit import COMMAND_TYPES
+from .codec import FrameCodec, decode_frame
+from .receive_queue import ReceiveQueue, OverflowPolicy
 from Crypto.Hash import SHA256
 from Crypto.PublicKey import RSA
 from Crypto.Cipher import PKCS1_OAEP, PKCS1_v1_5, AES
 from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import unpad, pad
-from base64 import b64encode, b64decode
+from base64 import b64encode
 import rx.operators as ops
 
 
+class ConnectionDeclinedError(Exception):
+    pass
+
+
+class CommandNackError(Exception):
+    def __init__(self, info, message_type=None):
+        self.info = info
+        self.message_type = message_type
+
+        reason = info
+        if isinstance(info, int) and info in Messages._value2member_map_:
+            reason = Messages(info).name
+
+        Exception.__init__(self, f"Command NACKed by bridge: {reason}")
+
+
+class CommandTimeoutError(Exception):
+    pass
+
+
+class SendPriority(IntEnum):
+    ACK = 0
+    SAFETY = 1
+    INTERACTIVE = 2
+    BULK = 3
+
+
+def _priority_for(message_type, payload):
+    if message_type == Messages.SET_DEVICE_SHADING_STATE:
+        if payload.get("state") == ShadeOperationState.STOP:
+            return SendPriority.SAFETY
+        return SendPriority.INTERACTIVE
+
+    if message_type in (Messages.ACTION_SLIDE_DEVICE, Messages.ACTION_SLIDE_ROOM, Messages.SET_HEATING_STATE):
+        return SendPriority.BULK
+
+    return SendPriority.INTERACTIVE
+
+
+def _target_of(data):
+    payload = data.get("payload")
+
+    if not isinstance(payload, dict):
+        return None
+
+    if "deviceId" in payload:
+        return ("device", payload["deviceId"])
+
+    if "roomId" in payload:
+        return ("room", payload["roomId"])
+
+    return None
+
+
+class _QueuedFrame:
+    __slots__ = ("seq", "priority", "enqueued_at", "data", "future", "target", "taken")
+
+    def __init__(self, seq, priority, data, future):
+        self.seq = seq
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.data = data
+        self.future = future
+        self.target = _target_of(data)
+        self.taken = False
+
+
+class SendQueueStats:
+    def __init__(self):
+        self.depth = 0
+        self.max_depth = 0
+        self.frames_written = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def mean_wait(self):
+        return self.total_wait / self.frames_written if self.frames_written else 0.0
+
+    def __str__(self):
+        return f"SendQueueStats(depth={self.depth}, max_depth={self.max_depth}, frames_written={self.frames_written}, mean_wait={self.mean_wait}, max_wait={self.max_wait})"
+
+    __repr__ = __str__
+
+
+class DecodeStats:
+    def __init__(self):
+        self.inline_frames = 0
+        self.inline_time = 0.0
+        self.max_inline_time = 0.0
+        self.max_inline_size = 0
+        self.offloaded_frames = 0
+        self.offloaded_time = 0.0
+
+    def __str__(self):
+        return f"DecodeStats({self.__dict__})"
+
+    __repr__ = __str__
+
+
 class ConnectionState(IntEnum):
     Initial = 1
     Loading = 2
@@ -45,7 +149,63 @@ def _pad_string(value):
     return value.ljust(length + pad_size, b'\x00')
 
 
-async def setup_secure_connection(session, ip_address, authkey):
+async def _resume_session(connection, token_store, device_id):
+    stored = token_store.load(device_id)
+
+    if stored is None or not stored.is_valid():
+        return None
+
+    await connection.send_message(Messages.AUTH_APPLY_TOKEN, {"token": stored.token})
+
+    msg = await connection.receive()
+
+    if msg.get('type_int') != Messages.AUTH_APPLY_TOKEN_RESPONSE or not msg['payload'].get('valid'):
+        token_store.clear(device_id)
+        return None
+
+    return stored.token, msg['payload'].get('remaining', 0)
+
+
+async def _login(connection, authkey, device_id):
+    salt = generateSalt()
+    password = hash(device_id.encode(), authkey.encode(), salt.encode())
+
+    await connection.send_message(30, {
+        "username": "default",
+        "password": password,
+        "salt": salt
+    })
+
+    msg = await connection.receive()
+
+    if msg['type_int'] != 32:
+        raise Exception("Login failed")
+
+    token = msg['payload']['token']
+    await connection.send_message(33, {"token": token})
+
+    # {"type_int":34,"mc":-1,"payload":{"valid":true,"remaining":8640000}}
+    msg = await connection.receive()
+
+    # Renew token
+    await connection.send_message(37, {"token": token})
+
+    msg = await connection.receive()
+
+    if msg['type_int'] != 38:
+        raise Exception("Login failed")
+
+    token = msg['payload']['token']
+
+    await connection.send_message(33, {"token": token})
+
+    # {"type_int":34,"mc":-1,"payload":{"valid":true,"remaining":8640000}}
+    msg = await connection.receive()
+
+    return token, msg.get('payload', {}).get('remaining', 0)
+
+
+async def setup_secure_connection(session, ip_address, authkey, token_store=None):
     async def __receive(ws):
         msg = await ws.receive()
         msg = msg.data[:-1]
@@ -64,7 +224,7 @@ async def setup_secure_connection(session, ip_address, authkey):
 
         #{'type_int': 0, 'ref': -1, 'info': 'no client-connection available (all used)!'}
         if msg['type_int'] == Messages.NACK:
-            raise Exception(msg["info"])
+            raise ConnectionDeclinedError(msg["info"])
 
         deviceId = msg['payload']['device_id']
         connectionId = msg['payload']['connection_id']
@@ -83,7 +243,7 @@ async def setup_secure_connection(session, ip_address, authkey):
         msg = await __receive(ws)
 
         if msg['type_int'] == Messages.CONNECTION_DECLINED:
-            raise Exception(msg["payload"]["error_message"])
+            raise ConnectionDeclinedError(msg["payload"]["error_message"])
 
         await __send(ws, {"type_int": 14, "mc": -1})
 
@@ -113,55 +273,93 @@ async def setup_secure_connection(session, ip_address, authkey):
         if msg['type_int'] != 17:
             raise Exception('Failed to establish secure connection')
 
-        salt = generateSalt()
-        password = hash(deviceId.encode(), authkey.encode(), salt.encode())
+        session = None
 
-        await connection.send_message(30, {
-            "username": "default",
-            "password": password,
-            "salt": salt
-        })
+        if token_store is not None:
+            session = await _resume_session(connection, token_store, deviceId)
 
-        msg = await connection.receive()
+        connection.resumed = session is not None
 
-        if msg['type_int'] != 32:
-            raise Exception("Login failed")
+        if session is None:
+            session = await _login(connection, authkey, deviceId)
 
-        token = msg['payload']['token']
-        await connection.send_message(33, {"token": token})
+        connection.token_store = token_store
+        connection._set_token(*session)
 
-        # {"type_int":34,"mc":-1,"payload":{"valid":true,"remaining":8640000}}
-        msg = await connection.receive()
+        return connection
+    except:
+        await ws.close()
+        raise
 
-        # Renew token
-        await connection.send_message(37, {"token": token})
 
-        msg = await connection.receive()
+class TokenRenewalStats:
+    def __init__(self):
+        self.renewals = 0
+        self.failures = 0
+        self.last_renewed_at = None
+        self.last_duration = None
+        self.next_renewal_at = None
+        self.expires_at = None
 
-        if msg['type_int'] != 38:
-            raise Exception("Login failed")
+    def __str__(self):
+        return f"TokenRenewalStats({self.__dict__})"
 
-        token = msg['payload']['token']
+    __repr__ = __str__
 
-        await connection.send_message(33, {"token": token})
 
-        # {"type_int":34,"mc":-1,"payload":{"valid":true,"remaining":8640000}}
-        msg = await connection.receive()
+class SecureBridgeConnection:
+    # Renew once this fraction of the token lifetime has passed, and never
+    # later than renew_margin seconds before it expires.
+    renew_fraction = 0.5
+    renew_margin = 300
+    renew_retry = 30
+    renew_timeout = 10
 
-        return connection
-    except:
-        await ws.close()
-        raise
+    command_timeout = 5.0
+    command_retries = 1
+    max_in_flight = 8
 
+    drain_timeout = 5.0
+
+    # Frames at least this large are decoded in decode_executor (the loop's
+    # default thread pool when None) instead of on the event loop.
+    offload_threshold = 64 * 1024
+
+    receive_queue_size = 1000
+    overflow_policy = OverflowPolicy.Block
 
-class SecureBridgeConnection:
     def __init__(self, websocket, key, iv, device_id):
         self.websocket = websocket
         self.key = key
         self.iv = iv
         self.device_id = device_id
+        self.codec = FrameCodec(key, iv)
+        self.decode_executor = None
+        self.decode_stats = DecodeStats()
+        self.receive_queue = None
 
         self.state = ConnectionState.Initial
+        self.token = None
+        self.token_remaining = None
+        self.resumed = False
+        self.token_store = None
+        self.token_renewal = TokenRenewalStats()
+        self._auth_waiter = None
+        self._pending_acks = {}
+        # mc -> (time written or None while queued, timeout); expiry runs
+        # off a heap of deadlines so it does not depend on further sends
+        self._sent_at = {}
+        self._sent_deadlines = []
+        self._expiry_timer = None
+        self._expiry_at = None
+        self.rate_limiter = None
+        self._in_flight = None
+        self._send_queue = None
+        self._send_seq = 0
+        # Queued frames per device/room, in send order
+        self._queued_targets = {}
+        self._writer = None
+        self.send_queue_stats = SendQueueStats()
         self._messageSubject = rx.subject.Subject()
         self.mc = 0
 
@@ -169,19 +367,32 @@ class SecureBridgeConnection:
             ops.as_observable()
         )
 
-    def __cipher(self):
-        return AES.new(self.key, AES.MODE_CBC, self.iv)
-
     def __decrypt(self, data):
-        ct = b64decode(data)
-        data = self.__cipher().decrypt(ct)
-        data = data.rstrip(b'\x00')
-        # print(f"Received decrypted: {data}")
+        return self.codec.decode(data)
+
+    async def _decode(self, data):
+        stats = self.decode_stats
+
+        if self.offload_threshold is not None and len(data) >= self.offload_threshold:
+            started = time.perf_counter()
+            result = await asyncio.get_event_loop().run_in_executor(
+                self.decode_executor, decode_frame, *self.codec.offload_args(), data)
+
+            stats.offloaded_frames += 1
+            stats.offloaded_time += time.perf_counter() - started
+            return result
 
-        if not data:
-            return {}
+        started = time.perf_counter()
+        result = self.__decrypt(data)
+        stall = time.perf_counter() - started
 
-        return json.loads(data.decode())
+        stats.inline_frames += 1
+        stats.inline_time += stall
+        if stall > stats.max_inline_time:
+            stats.max_inline_time = stall
+            stats.max_inline_size = len(data)
+
+        return result
 
     async def pump(self):
         self.state = ConnectionState.Loading
@@ -190,21 +401,299 @@ class SecureBridgeConnection:
         await self.send_message(242, {})
         await self.send_message(2, {})
 
-        async for msg in self.websocket:
-            if msg.type == aiohttp.WSMsgType.TEXT:
-                result = self.__decrypt(msg.data)
+        self._start_writer()
+        self.receive_queue = ReceiveQueue(self.receive_queue_size, self.overflow_policy)
+        dispatcher = asyncio.ensure_future(self._dispatch_loop(self.receive_queue))
+        renewal_task = asyncio.ensure_future(self._renew_loop())
+
+        try:
+            async for msg in self.websocket:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    # Awaited in order, so offloaded frames cannot overtake others
+                    result = await self._decode(msg.data)
+
+                    if 'mc' in result:
+                        # ACK
+                        await self.send({"type_int": 1, "ref": result['mc']}, SendPriority.ACK, wait=False)
+
+                    if 'ref' in result and self._handle_ack(result):
+                        continue
+
+                    if self._handle_auth_response(result):
+                        continue
+
+                    if 'payload' in result:
+                        await self.receive_queue.put(result)
+
+                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    break
+
+            # Deliver what was read before the socket closed
+            self.receive_queue.close()
+            await dispatcher
+        finally:
+            dispatcher.cancel()
+            renewal_task.cancel()
+            self._stop_writer()
+            self._fail_pending_acks(Exception("Connection closed"))
+
+    def _start_writer(self):
+        self._send_queue = asyncio.PriorityQueue()
+        self._writer = asyncio.ensure_future(self._write_loop())
+
+    async def _write_loop(self):
+        stats = self.send_queue_stats
 
-                if 'mc' in result:
-                    # ACK
-                    await self.send({"type_int": 1, "ref": result['mc']})
+        while True:
+            _, _, frame = await self._send_queue.get()
+            stats.depth = self._send_queue.qsize()
+            data, future = frame.data, frame.future
 
-                if 'payload' in result:
-                    self._messageSubject.on_next(result)
+            try:
+                # Promoted frames are queued twice, only the first copy counts
+                if frame.taken:
+                    continue
 
-            elif msg.type == aiohttp.WSMsgType.ERROR:
-                break
+                frame.taken = True
+                self._untrack(frame)
+
+                if future is not None and future.done():
+                    continue
+
+                wait = time.monotonic() - frame.enqueued_at
+                stats.total_wait += wait
+                stats.max_wait = max(stats.max_wait, wait)
+
+                await self._write(data)
+                stats.frames_written += 1
+
+                if future is not None:
+                    future.set_result(None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            finally:
+                self._send_queue.task_done()
+
+    def _stop_writer(self):
+        if self._writer is None:
+            return
+
+        self._writer.cancel()
+        self._writer = None
+
+        while not self._send_queue.empty():
+            frame = self._send_queue.get_nowait()[2]
+            self._send_queue.task_done()
+            frame.taken = True
+
+            if frame.future is not None and not frame.future.done():
+                frame.future.set_exception(Exception("Connection closed"))
+
+        self._queued_targets.clear()
+        self.send_queue_stats.depth = 0
+
+    def _untrack(self, frame):
+        queued = self._queued_targets.get(frame.target)
+
+        if queued is None:
+            return
+
+        queued.remove(frame)
+        if not queued:
+            del self._queued_targets[frame.target]
+
+        if self._expiry_timer is not None:
+            self._expiry_timer.cancel()
+            self._expiry_timer = None
+
+        self._sent_at.clear()
+        self._sent_deadlines.clear()
+
+    def _track_sent(self, mc, timeout=None):
+        self._sent_at[mc] = (None, self.command_timeout if timeout is None else timeout)
+
+    def _mark_written(self, mc):
+        entry = self._sent_at.get(mc)
+
+        if entry is None or entry[0] is not None:
+            return
+
+        now = time.monotonic()
+        timeout = entry[1]
+        self._sent_at[mc] = (now, timeout)
+        heapq.heappush(self._sent_deadlines, (now + timeout, mc))
+        self._schedule_expiry()
+
+    def _schedule_expiry(self):
+        if not self._sent_deadlines:
+            return
+
+        deadline = self._sent_deadlines[0][0]
+
+        if self._expiry_timer is not None:
+            if self._expiry_at <= deadline:
+                return
+            self._expiry_timer.cancel()
+
+        loop = asyncio.get_event_loop()
+        self._expiry_at = deadline
+        self._expiry_timer = loop.call_later(max(0, deadline - time.monotonic()), self._expire_sent)
+
+    def _expire_sent(self):
+        self._expiry_timer = None
+        now = time.monotonic()
+
+        while self._sent_deadlines and self._sent_deadlines[0][0] <= now:
+            deadline, mc = heapq.heappop(self._sent_deadlines)
+            entry = self._sent_at.get(mc)
+
+            # Already answered, or re-stamped with a later deadline
+            if entry is None or entry[0] + entry[1] != deadline:
+                continue
+
+            del self._sent_at[mc]
+            if self.rate_limiter is not None:
+                self.rate_limiter.record_timeout()
+
+        self._schedule_expiry()
+
+    def _observe_ack(self, result):
+        entry = self._sent_at.pop(result['ref'], None)
+
+        if entry is None or entry[0] is None or self.rate_limiter is None:
+            return
+
+        if result.get('type_int') == Messages.NACK:
+            self.rate_limiter.record_nack(result.get('info'))
+        else:
+            self.rate_limiter.record_ack(time.monotonic() - entry[0])
+
+    async def _dispatch_loop(self, queue):
+        while True:
+            message = await queue.get()
+
+            if message is None:
+                return
+
+            try:
+                self._messageSubject.on_next(message)
+            except Exception:
+                # A failing subscriber must not stop delivery to the others
+                pass
+
+    def _handle_ack(self, result):
+        self._observe_ack(result)
+
+        future = self._pending_acks.pop(result['ref'], None)
+
+        if future is None or future.done():
+            return False
+
+        if result.get('type_int') == Messages.NACK:
+            future.set_exception(CommandNackError(result.get('info')))
+        else:
+            future.set_result(result)
+
+        return True
+
+    def _fail_pending_acks(self, error):
+        for future in self._pending_acks.values():
+            if not future.done():
+                future.set_exception(error)
+
+        self._pending_acks.clear()
+
+    def _handle_auth_response(self, result):
+        if self._auth_waiter is None or self._auth_waiter.done():
+            return False
+
+        if result.get('type_int') not in (Messages.AUTH_LOGIN_DENIED,
+                                          Messages.AUTH_APPLY_TOKEN_RESPONSE,
+                                          Messages.AUTH_RENEW_TOKEN_RESPONSE):
+            return False
+
+        self._auth_waiter.set_result(result)
+        return True
+
+    async def _auth_request(self, message_type, payload):
+        self._auth_waiter = asyncio.get_event_loop().create_future()
+
+        try:
+            await self.send_message(message_type, payload)
+            return await asyncio.wait_for(self._auth_waiter, self.renew_timeout)
+        finally:
+            self._auth_waiter = None
+
+    def _set_token(self, token, remaining):
+        self.token = token
+        self.token_remaining = remaining
+        self.token_renewal.expires_at = time.time() + remaining
+
+        if self.token_store is not None:
+            self.token_store.save(self.device_id, token, remaining)
+
+    def _renewal_delay(self):
+        remaining = max(0, self.token_renewal.expires_at - time.time())
+        delay = remaining * self.renew_fraction
+
+        if remaining - delay < self.renew_margin:
+            # Short-lived token, pull the renewal in but keep it from spinning
+            delay = max(remaining - self.renew_margin, delay / 2)
+
+        return delay
+
+    async def _renew_loop(self):
+        if self.token is None or not self.token_remaining:
+            return
+
+        if self.token_renewal.expires_at is None:
+            self.token_renewal.expires_at = time.time() + self.token_remaining
+
+        while True:
+            delay = self._renewal_delay()
+            self.token_renewal.next_renewal_at = time.time() + delay
+            await asyncio.sleep(delay)
+
+            try:
+                await self.renew_token()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.token_renewal.failures += 1
+                self.token_renewal.next_renewal_at = time.time() + self.renew_retry
+                await asyncio.sleep(self.renew_retry)
+
+    async def renew_token(self):
+        started = time.monotonic()
+
+        msg = await self._auth_request(Messages.AUTH_RENEW_TOKEN, {"token": self.token})
+
+        if msg['type_int'] != Messages.AUTH_RENEW_TOKEN_RESPONSE:
+            raise Exception("Token renewal failed")
+
+        token = msg['payload']['token']
+
+        msg = await self._auth_request(Messages.AUTH_APPLY_TOKEN, {"token": token})
+
+        if msg['type_int'] != Messages.AUTH_APPLY_TOKEN_RESPONSE or not msg['payload'].get('valid'):
+            raise Exception("Token renewal failed")
+
+        self._set_token(token, msg['payload'].get('remaining', 0))
+
+        self.token_renewal.renewals += 1
+        self.token_renewal.last_renewed_at = time.time()
+        self.token_renewal.last_duration = time.monotonic() - started
+
+    async def close(self, drain=False):
+        if drain and self._writer is not None:
+            try:
+                await asyncio.wait_for(self._send_queue.join(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                pass
 
-    async def close(self):
         await self.websocket.close()
 
     async def receive(self):
@@ -212,18 +701,89 @@ class SecureBridgeConnection:
 
         return self.__decrypt(msg.data)
 
-    async def send_message(self, message_type, payload):
-        self.mc += 1
-
+    async def send_message(self, message_type, payload, wait_for_ack=False, timeout=None, retries=None, priority=None):
         if isinstance(message_type, Messages):
             message_type = message_type.value
 
-        await self.send({"type_int": message_type, "mc": self.mc, "payload": payload})
+        if priority is None:
+            priority = _priority_for(message_type, payload)
 
-    async def send(self, data):
-        msg = json.dumps(data)
-        # print(f"Send raw: {msg}")
-        msg = _pad_string(msg.encode())
-        msg = self.__cipher().encrypt(msg)
-        msg = b64encode(msg).decode() + '\u0004'
-        await self.websocket.send_str(msg)
+        track = self.rate_limiter is not None and message_type in COMMAND_TYPES
+
+        if not wait_for_ack:
+            self.mc += 1
+            if track:
+                self._track_sent(self.mc, timeout)
+            await self.send({"type_int": message_type, "mc": self.mc, "payload": payload}, priority)
+            return None
+
+        if timeout is None:
+            timeout = self.command_timeout
+
+        if retries is None:
+            retries = self.command_retries
+
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+
+        async with self._in_flight:
+            for attempt in range(retries + 1):
+                self.mc += 1
+                mc = self.mc
+
+                future = asyncio.get_event_loop().create_future()
+                self._pending_acks[mc] = future
+                if track:
+                    self._track_sent(mc, timeout)
+
+                try:
+                    await self.send({"type_int": message_type, "mc": mc, "payload": payload}, priority)
+                    return await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    pass
+                except CommandNackError as e:
+                    e.message_type = message_type
+                    raise
+                finally:
+                    self._pending_acks.pop(mc, None)
+
+        raise CommandTimeoutError(f"No ACK for message {message_type} after {retries + 1} attempts")
+
+    async def send(self, data, priority=SendPriority.INTERACTIVE, wait=True):
+        if self._writer is None:
+            # Handshake, before pump() has started the writer
+            await self._write(data)
+            return
+
+        future = asyncio.get_event_loop().create_future() if wait else None
+
+        self._send_seq += 1
+        frame = _QueuedFrame(self._send_seq, priority, data, future)
+
+        if frame.target is not None:
+            queued = self._queued_targets.setdefault(frame.target, [])
+
+            # Priorities only reorder frames for different targets. Earlier
+            # frames for this target are promoted so they still go out first.
+            for earlier in queued:
+                if earlier.priority > priority:
+                    earlier.priority = priority
+                    self._send_queue.put_nowait((priority, earlier.seq, earlier))
+
+            queued.append(frame)
+
+        self._send_queue.put_nowait((priority, frame.seq, frame))
+
+        stats = self.send_queue_stats
+        stats.depth = self._send_queue.qsize()
+        stats.max_depth = max(stats.max_depth, stats.depth)
+
+        if future is not None:
+            await future
+
+    async def _write(self, data):
+        await self.websocket.send_str(self.codec.encode(data))
+
+        if self._sent_at and 'mc' in data:
+            # Latency is measured from the wire, not from the send queue
+            self._mark_written(data['mc'])
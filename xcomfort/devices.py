@@ -1,19 +1,23 @@
 from contextlib import nullcontext
-import rx
 from .messages import Messages, ShadeOperationState
+from .state import StatePublisher, FrozenState
+
+class DeviceState(FrozenState):
+    __slots__ = ('raw',)
+    _fields = ('raw',)
 
-class DeviceState:
     def __init__(self, payload):
-        self.raw = payload
+        FrozenState.__init__(self, raw=payload)
 
     def __str__(self):
         return f"DeviceState({self.raw})"
 
 class LightState(DeviceState):
+    __slots__ = ('switch', 'dimmvalue')
+    _fields = ('switch', 'dimmvalue')
+
     def __init__(self, switch, dimmvalue, payload):
-        DeviceState.__init__(self, payload)
-        self.switch = switch
-        self.dimmvalue = dimmvalue
+        FrozenState.__init__(self, raw=payload, switch=switch, dimmvalue=dimmvalue)
 
     def __str__(self):
         return f"LightState({self.switch}, {self.dimmvalue})"
@@ -21,10 +25,11 @@ class LightState(DeviceState):
     __repr__ = __str__
 
 class RcTouchState(DeviceState):
+    __slots__ = ('temperature', 'humidity')
+    _fields = ('temperature', 'humidity')
+
     def __init__(self, temperature, humidity, payload):
-        DeviceState.__init__(self, payload)
-        self.temperature = temperature
-        self.humidity = humidity
+        FrozenState.__init__(self, raw=payload, temperature=temperature, humidity=humidity)
 
     def __str__(self):
         return f"RcTouchState({self.temperature}, {self.humidity})"
@@ -32,34 +37,42 @@ class RcTouchState(DeviceState):
     __repr__ = __str__
 
 class HeaterState(DeviceState):
+    __slots__ = ()
+
     def __init__(self, payload):
         DeviceState.__init__(self, payload)
 
     def __str__(self):
-        return f"HeaterState({self.payload})"
+        return f"HeaterState({self.raw})"
 
     __repr__ = __str__
 
 
 class ShadeState(DeviceState):
-
-    def __init__(self):
-        self.raw = {}
-        self.current_state: int | None = None
-        self.is_safety_enabled: bool | None = None
-        self.position: int | None = None
-
-    def update_from_partial_state_update(self, payload: dict) -> None:
-        self.raw.update(payload)
-
-        if (current_state := payload.get("curstate")) is not None:
-            self.current_state = current_state
-
+    __slots__ = ('current_state', 'is_safety_enabled', 'position')
+    _fields = ('current_state', 'is_safety_enabled', 'position')
+
+    def __init__(self, current_state: int | None = None, is_safety_enabled: bool | None = None,
+                 position: int | None = None, payload: dict | None = None):
+        FrozenState.__init__(self, raw=payload, current_state=current_state,
+                             is_safety_enabled=is_safety_enabled, position=position)
+
+    def updated(self, payload: dict, raw=None) -> "ShadeState":
+        # We get partial updates across different messages, so fields missing
+        # from the payload keep their previous value
+        current_state = self.current_state
+        if (value := payload.get("curstate")) is not None:
+            current_state = value
+
+        is_safety_enabled = self.is_safety_enabled
         if (safety := payload.get("shSafety")) is not None:
-            self.is_safety_enabled = safety != 0
+            is_safety_enabled = safety != 0
+
+        position = self.position
+        if (value := payload.get("shPos")) is not None:
+            position = value
 
-        if (position := payload.get("shPos")) is not None:
-            self.position = position
+        return ShadeState(current_state, is_safety_enabled, position, raw)
 
     @property
     def is_closed(self) -> bool | None:
@@ -73,16 +86,119 @@ class ShadeState(DeviceState):
     def __str__(self) -> str:
         return f"ShadeState(current_state={self.current_state} is_safety_enabled={self.is_safety_enabled} position={self.position} raw={self.raw})"
 
-class BridgeDevice:
+class BridgeDevice(StatePublisher):
     def __init__(self, bridge, device_id, name):
         self.bridge = bridge
         self.device_id = device_id
         self.name = name
+        # Set by the bridge from the device payload; component follows the
+        # bridge's comps as they are added and removed
+        self.dev_type = None
+        self.comp_id = None
+        self.component = None
 
-        self.state = rx.subject.BehaviorSubject(None)
+        self._init_state()
+
+    @classmethod
+    def from_payload(cls, bridge, payload):
+        return cls(bridge, payload['deviceId'], payload['name'])
 
     def handle_state(self, payload):
-        self.state.on_next(DeviceState(payload))
+        self._publish_state(DeviceState(payload))
+
+
+class DecodedState(DeviceState):
+    __slots__ = ()
+
+    def __init__(self, raw=None, **fields):
+        FrozenState.__init__(self, raw=raw, **fields)
+
+    def __str__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)}" for name in self._fields)
+        return f"{type(self).__name__}({fields})"
+
+    __repr__ = __str__
+
+
+class StateDecoder:
+    # Builds a slotted state class for a device type and decodes payloads by
+    # picking only the listed keys. fields maps each state attribute to a
+    # payload key, or to (payload key, convert). Attributes missing from a
+    # payload keep their previous value.
+    def __init__(self, name: str, fields: dict):
+        specs = []
+
+        for attribute, spec in fields.items():
+            key, convert = (spec, None) if isinstance(spec, str) else spec
+            specs.append((attribute, key, convert))
+
+        self._specs = tuple(specs)
+        self._keys = frozenset(key for _, key, _ in specs)
+
+        attributes = tuple(fields)
+        self.state_class = type(name, (DecodedState,), {"__slots__": attributes, "_fields": attributes})
+
+    def decode(self, payload, previous=None, raw=None):
+        if self._keys.isdisjoint(payload):
+            return None
+
+        values = {}
+
+        for attribute, key, convert in self._specs:
+            if key in payload:
+                value = payload[key]
+                values[attribute] = value if convert is None or value is None else convert(value)
+            else:
+                values[attribute] = getattr(previous, attribute, None)
+
+        return self.state_class(raw, **values)
+
+
+class DecodedDevice(BridgeDevice):
+    # Base for device types whose state is fully described by a StateDecoder
+    decoder = None
+
+    def handle_state(self, payload):
+        state = self.decoder.decode(payload, self.confirmed_state, self._retain_raw(payload))
+
+        if state is not None:
+            self._publish_state(state)
+
+
+# devType -> device class, and compType -> device class for device types
+# that are not registered themselves
+DEVICE_TYPES = {}
+COMP_TYPES = {}
+
+
+def register_device_type(dev_types=(), device_class=None, comp_types=()):
+    # Usable directly or as a class decorator. Device classes are created
+    # through their from_payload classmethod.
+    if isinstance(dev_types, int):
+        dev_types = (dev_types,)
+    if isinstance(comp_types, int):
+        comp_types = (comp_types,)
+
+    def register(device_class):
+        for dev_type in dev_types:
+            DEVICE_TYPES[dev_type] = device_class
+        for comp_type in comp_types:
+            COMP_TYPES[comp_type] = device_class
+        return device_class
+
+    if device_class is not None:
+        return register(device_class)
+
+    return register
+
+
+def device_class_for(dev_type, comp_type=None):
+    device_class = DEVICE_TYPES.get(dev_type)
+
+    if device_class is None and comp_type is not None:
+        device_class = COMP_TYPES.get(comp_type)
+
+    return device_class or BridgeDevice
 
 
 class Light(BridgeDevice):
@@ -91,12 +207,16 @@ class Light(BridgeDevice):
 
         self.dimmable = dimmable
 
+    @classmethod
+    def from_payload(cls, bridge, payload):
+        return cls(bridge, payload['deviceId'], payload['name'], payload['dimmable'])
+
     def interpret_dimmvalue_from_payload(self, switch, payload):
         if not self.dimmable:
             return 99
 
         if not switch:
-            return self.state.value.dimmvalue if self.state.value is not None else 99
+            return self.confirmed_state.dimmvalue if self.confirmed_state is not None else 99
         
         return payload['dimmvalue']
 
@@ -105,14 +225,16 @@ class Light(BridgeDevice):
         switch = payload['switch']
         dimmvalue = self.interpret_dimmvalue_from_payload(switch, payload)
 
-        self.state.on_next(LightState(switch, dimmvalue, payload))
+        self._publish_state(LightState(switch, dimmvalue, self._retain_raw(payload)))
 
     async def switch(self, switch: bool):
-        await self.bridge.switch_device(self.device_id, {"switch": switch})
+        return await self._send_optimistic(
+            self.bridge.switch_device(self.device_id, {"switch": switch}), switch=switch)
 
     async def dimm(self, value: int):
         value = max(0, min(99, value))
-        await self.bridge.slide_device(self.device_id, {"dimmvalue": value})
+        return await self._send_optimistic(
+            self.bridge.slide_device(self.device_id, {"dimmvalue": value}), switch=value > 0, dimmvalue=value)
 
     def __str__(self):
         return f"Light({self.device_id}, \"{self.name}\", dimmable: {self.dimmable}, state:{self.state.value})"
@@ -126,6 +248,10 @@ class RcTouch(BridgeDevice):
 
         self.comp_id = comp_id
 
+    @classmethod
+    def from_payload(cls, bridge, payload):
+        return cls(bridge, payload['deviceId'], payload['name'], payload['compId'])
+
     def handle_state(self, payload):
         print(f"RcTouchState::: {payload}")
         temperature = None
@@ -138,7 +264,7 @@ class RcTouch(BridgeDevice):
                     humidity = float(info['value'])
 
         if temperature is not None and humidity is not None:
-            self.state.on_next(RcTouchState(temperature, humidity, payload))
+            self._publish_state(RcTouchState(temperature, humidity, self._retain_raw(payload)))
 
 
 class Heater(BridgeDevice):
@@ -147,6 +273,10 @@ class Heater(BridgeDevice):
 
         self.comp_id = comp_id
 
+    @classmethod
+    def from_payload(cls, bridge, payload):
+        return cls(bridge, payload['deviceId'], payload['name'], payload['compId'])
+
 class Shade(BridgeDevice):
     def __init__(self, bridge, device_id, name, comp_id, payload):
         BridgeDevice.__init__(self, bridge, device_id, name)
@@ -160,17 +290,25 @@ class Shade(BridgeDevice):
 
         self.comp_id = comp_id
 
+    @classmethod
+    def from_payload(cls, bridge, payload):
+        return cls(bridge, payload['deviceId'], payload['name'], payload['compId'], payload)
+
     @property
     def supports_go_to(self) -> bool | None:
         # "go to" is whether a specific position can be set, i.e. 50 meaning halfway down
         # Not all actuators support this, even if they can be stopped at arbitrary positions.
-        if (component := self.bridge._comps.get(self.comp_id)) is not None:
-            return component.comp_type == 86 and self.payload.get("shRuntime") == 1
+        if self.component is not None:
+            return self.component.comp_type == 86 and self.payload.get("shRuntime") == 1
         return None
 
     def handle_state(self, payload):
-        self.__shade_state.update_from_partial_state_update(payload)
-        self.state.on_next(self.__shade_state)
+        raw = self._retain_raw(payload)
+        if raw is not None and self.__shade_state.raw is not None:
+            raw = {**self.__shade_state.raw, **raw}
+
+        self.__shade_state = self.__shade_state.updated(payload, raw)
+        self._publish_state(self.__shade_state)
 
     async def send_state(self, state, **kw):
         if self.__shade_state.is_safety_enabled:
@@ -178,9 +316,15 @@ class Shade(BridgeDevice):
             # this check in the client, so we do that too just to be safe.
             return
 
-        await self.bridge.send_message(
-            Messages.SET_DEVICE_SHADING_STATE, {"deviceId": self.device_id, "state": state, **kw}
-        )
+        command = self.bridge.send_message(
+            Messages.SET_DEVICE_SHADING_STATE, {"deviceId": self.device_id, "state": state, **kw})
+
+        # Only a position target is known up front, so open, close and stop
+        # have no expected state to publish
+        if state == ShadeOperationState.GO_TO:
+            await self._send_optimistic(command, position=kw["value"])
+        else:
+            await command
 
     async def move_down(self):
         await self.send_state(ShadeOperationState.CLOSE)
@@ -200,3 +344,9 @@ class Shade(BridgeDevice):
 
     def __str__(self) -> str:
         return f"<Shade device_id={self.device_id} name={self.name} state={self.state} supports_go_to={self.supports_go_to}>"
+
+
+register_device_type((100, 101), Light)
+register_device_type(102, Shade)
+register_device_type(440, Heater)
+register_device_type(450, RcTouch)
@@ -0,0 +1,164 @@
+import aiohttp
+import asyncio
+import rx
+from collections.abc import Mapping
+from .bridge import Bridge, State
+
+
+class GroupState:
+    def __init__(self, bridge_key, kind: str, entity, state):
+        self.bridge_key = bridge_key
+        self.kind = kind
+        self.entity = entity
+        self.state = state
+
+    def __str__(self):
+        return f"GroupState({self.bridge_key}, {self.kind}, {self.state})"
+
+    __repr__ = __str__
+
+
+class MergedIndex(Mapping):
+    # Read-only view keyed by (bridge_key, id) over the per-bridge dicts,
+    # so nothing is copied when bridges add entities.
+    def __init__(self, bridges, attribute):
+        self._bridges = bridges
+        self._attribute = attribute
+
+    def __getitem__(self, key):
+        bridge_key, entity_id = key
+        return getattr(self._bridges[bridge_key], self._attribute)[entity_id]
+
+    def __iter__(self):
+        for bridge_key, bridge in self._bridges.items():
+            for entity_id in getattr(bridge, self._attribute):
+                yield (bridge_key, entity_id)
+
+    def __len__(self):
+        return sum(len(getattr(bridge, self._attribute)) for bridge in self._bridges.values())
+
+
+class BridgeGroup:
+    def __init__(self, session=None, stagger: float = 0.5, max_concurrent_handshakes: int = 4):
+        if session is None:
+            session = aiohttp.ClientSession()
+            closeSession = True
+        else:
+            closeSession = False
+
+        self._session = session
+        self._closeSession = closeSession
+
+        self.stagger = stagger
+        self.max_concurrent_handshakes = max_concurrent_handshakes
+        self._handshake_limiter = None
+
+        self.bridges = {}
+        self._tasks = {}
+        self._running = False
+        self._subscriptions = []
+        self._entity_subscriptions = {}
+
+        self.devices = MergedIndex(self.bridges, "_devices")
+        self.rooms = MergedIndex(self.bridges, "_rooms")
+        self.comps = MergedIndex(self.bridges, "_comps")
+        self.scenes = MergedIndex(self.bridges, "_scenes")
+
+        self.states = rx.subject.Subject()
+        self.logger = lambda x: None
+
+    def add_bridge(self, key, ip_address: str, authkey: str, **kwargs) -> Bridge:
+        if key in self.bridges:
+            raise Exception(f"Bridge {key} already added")
+
+        bridge = Bridge(ip_address, authkey, session=self._session, **kwargs)
+        bridge.logger = lambda x, key=key: self.logger(f"[{key}] {x}")
+        bridge.handshake_limiter = self._get_handshake_limiter()
+
+        self._subscriptions.append(bridge.topology_changes.subscribe(
+            lambda change, key=key: self._on_topology_change(key, change)))
+
+        self.bridges[key] = bridge
+
+        if self._running:
+            self._start(key, 0)
+
+        return bridge
+
+    def _get_handshake_limiter(self):
+        if self._handshake_limiter is None:
+            self._handshake_limiter = asyncio.Semaphore(self.max_concurrent_handshakes)
+
+        return self._handshake_limiter
+
+    def _on_topology_change(self, bridge_key, change):
+        kind = change.kind
+        key = (bridge_key, kind, getattr(change.entity, f"{kind}_id", None))
+        current = self._entity_subscriptions.get(key)
+
+        if change.action == "removed" or (change.action == "changed" and current is not None
+                                          and current[0] is not change.entity):
+            # Entities are replaced when their type or other topology changed
+            if current is not None:
+                current[1].dispose()
+                del self._entity_subscriptions[key]
+                current = None
+
+        # Scenes have no state to forward
+        if change.action not in ("added", "changed") or current is not None or change.kind == "scene":
+            return
+
+        def forward(state):
+            if state is not None:
+                self.states.on_next(GroupState(bridge_key, kind, change.entity, state))
+
+        self._entity_subscriptions[key] = (change.entity, change.entity.state.subscribe(forward))
+
+    async def _run_bridge(self, key, delay):
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        await self.bridges[key].run()
+
+    def _start(self, key, delay):
+        self._tasks[key] = asyncio.ensure_future(self._run_bridge(key, delay))
+
+    async def run(self):
+        self._running = True
+
+        for index, key in enumerate(self.bridges):
+            self._start(key, index * self.stagger)
+
+        try:
+            while self._tasks:
+                tasks = list(self._tasks.values())
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+                for key, task in list(self._tasks.items()):
+                    if task.done():
+                        del self._tasks[key]
+        finally:
+            self._running = False
+
+    async def wait_for_initialization(self, timeout: float | None = None):
+        await asyncio.gather(*(bridge.wait_for_initialization(timeout) for bridge in self.bridges.values()))
+
+    async def close(self):
+        for key, task in self._tasks.items():
+            # Bridges still waiting for their staggered start are never run
+            if self.bridges[key].state == State.Uninitialized:
+                task.cancel()
+
+        await asyncio.gather(*(bridge.close() for bridge in self.bridges.values()), return_exceptions=True)
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+        for subscription in self._subscriptions:
+            subscription.dispose()
+        self._subscriptions.clear()
+
+        for _, subscription in self._entity_subscriptions.values():
+            subscription.dispose()
+        self._entity_subscriptions.clear()
+
+        if self._closeSession:
+            await self._session.close()
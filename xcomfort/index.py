@@ -0,0 +1,88 @@
+# Entity attributes indexed per kind, as (index name, attribute)
+_INDEXED = {
+    "device": (("comp", "comp_id"), ("type", "dev_type"), ("name", "name")),
+    "room": (("name", "name"),),
+    "comp": (("type", "comp_type"), ("name", "name")),
+    "scene": (("name", "name"),),
+}
+
+_EMPTY = frozenset()
+
+
+class TopologyIndex:
+    # Secondary indexes from attribute values to entity ids, kept current by
+    # the bridge's topology_changes. Room membership is indexed both ways.
+    # Most values (names in particular) map to a single entity, so a bare id
+    # is stored until a second entity shares the value.
+    def __init__(self):
+        self._indexes = {}
+        # (kind, id) -> the indexed values, in _INDEXED order, followed by
+        # the member device ids for rooms
+        self._entries = {}
+
+    def on_change(self, change):
+        entity_id = getattr(change.entity, f"{change.kind}_id", None)
+
+        if change.action == "removed":
+            self.remove(change.kind, entity_id)
+        elif change.action in ("added", "changed"):
+            self.add(change.kind, entity_id, change.entity)
+
+    def _insert(self, index_key, value, member_id):
+        if value is None:
+            return
+
+        index = self._indexes.setdefault(index_key, {})
+        members = index.get(value, _EMPTY)
+
+        if members is _EMPTY:
+            index[value] = member_id
+        elif isinstance(members, set):
+            members.add(member_id)
+        elif members != member_id:
+            index[value] = {members, member_id}
+
+    def _discard(self, index_key, value, member_id):
+        if value is None:
+            return
+
+        index = self._indexes[index_key]
+        members = index.get(value, _EMPTY)
+
+        if isinstance(members, set):
+            members.discard(member_id)
+            if len(members) == 1:
+                index[value] = members.pop()
+        elif members == member_id:
+            del index[value]
+
+    def add(self, kind, entity_id, entity):
+        self.remove(kind, entity_id)
+
+        values = tuple(getattr(entity, attribute, None) for _, attribute in _INDEXED.get(kind, ()))
+        if kind == "room":
+            values += (tuple(entity.device_ids),)
+
+        self._entries[(kind, entity_id)] = values
+        self._apply(self._insert, kind, entity_id, values)
+
+    def remove(self, kind, entity_id):
+        values = self._entries.pop((kind, entity_id), None)
+
+        if values is not None:
+            self._apply(self._discard, kind, entity_id, values)
+
+    def _apply(self, operation, kind, entity_id, values):
+        for (name, _), value in zip(_INDEXED.get(kind, ()), values):
+            operation((kind, name), value, entity_id)
+
+        if kind == "room":
+            for device_id in values[-1]:
+                operation(("device", "room"), entity_id, device_id)
+                operation(("room", "device"), device_id, entity_id)
+
+    def lookup(self, kind, name, value):
+        # The returned set may be live, copy it before keeping it around
+        members = self._indexes.get((kind, name), {}).get(value, _EMPTY)
+
+        return members if isinstance(members, (set, frozenset)) else frozenset((members,))
@@ -0,0 +1,140 @@
+import asyncio
+import heapq
+import time
+from .messages import Messages
+
+# NACKs caused by the command itself, not by the bridge being overloaded
+_CLIENT_ERRORS = (
+    Messages.NACK_INFO_UNKNOWN_DEVICE,
+    Messages.NACK_INFO_DEVICE_NOT_DIMMABLE,
+    Messages.NACK_INFO_INVALID_ACTION,
+)
+
+# Commands that go out over the RF network and are paced by the limiter
+COMMAND_TYPES = frozenset((
+    Messages.ACTION_SLIDE_DEVICE,
+    Messages.ACTION_SWITCH_DEVICE,
+    Messages.ACTION_SLIDE_ROOM,
+    Messages.ACTION_SWITCH_ROOM,
+    Messages.ACTIVATE_SCENE,
+    Messages.SET_HEATING_STATE,
+    Messages.SET_ROOM_SHADING_STATE,
+    Messages.SET_DEVICE_SHADING_STATE,
+))
+
+
+class AdaptiveRateLimiter:
+    # Token bucket whose refill rate follows AIMD: it grows additively while
+    # ACKs come back faster than target_latency, and is cut multiplicatively
+    # on slow ACKs, overload NACKs and timeouts (at most once per cooldown).
+    def __init__(self,
+                 rate: float = 10.0,
+                 burst: int = 10,
+                 min_rate: float = 1.0,
+                 max_rate: float = 50.0,
+                 target_latency: float = 0.5,
+                 increase: float = 0.5,
+                 decrease: float = 0.5,
+                 cooldown: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self.acks = 0
+        self.nacks = 0
+        self.timeouts = 0
+        self.latency = None
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._waiters = []
+        self._waiter_seq = 0
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # Priorities at or below this (SendPriority.SAFETY) never wait. They
+    # still take a token, which may leave the bucket in debt.
+    unpaced_priority = 1
+
+    async def acquire(self, priority: int = 2):
+        # Waiters are served by priority (lower first), in arrival order
+        # within a priority, so queued bulk commands do not hold up
+        # interactive ones
+        self._refill()
+
+        if priority <= self.unpaced_priority or (not self._waiters and self._tokens >= 1):
+            self._tokens -= 1
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        self._waiter_seq += 1
+        heapq.heappush(self._waiters, (priority, self._waiter_seq, future))
+        self._schedule_release()
+
+        await future
+
+    def _schedule_release(self):
+        if self._timer is not None or not self._waiters:
+            return
+
+        delay = max(0.0, (1 - self._tokens) / self.rate)
+        self._timer = asyncio.get_event_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        self._refill()
+
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+
+            # Cancelled waiters give up their place
+            if future.done():
+                continue
+
+            self._tokens -= 1
+            future.set_result(None)
+
+        self._schedule_release()
+
+    def _slow_down(self):
+        now = time.monotonic()
+
+        if now - self._last_decrease < self.cooldown:
+            return
+
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+
+    def record_ack(self, latency: float):
+        self.acks += 1
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+        if latency > self.target_latency:
+            self._slow_down()
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def record_nack(self, info=None):
+        self.nacks += 1
+
+        if info not in _CLIENT_ERRORS:
+            self._slow_down()
+
+    def record_timeout(self):
+        self.timeouts += 1
+        self._slow_down()
+
+    def __str__(self):
+        return f"AdaptiveRateLimiter(rate={self.rate:.1f}/s, latency={self.latency}, acks={self.acks}, nacks={self.nacks}, timeouts={self.timeouts})"
+
+    __repr__ = __str__
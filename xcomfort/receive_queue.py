@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections import deque
+from enum import Enum
+from .messages import Messages
+
+
+class OverflowPolicy(Enum):
+    # Stop reading the socket until the dispatcher catches up
+    Block = 1
+    # Drop the oldest queued state update to make room
+    DropOldest = 2
+    # Merge queued state updates for the same entity, keeping the newest values
+    Coalesce = 3
+
+
+_STATE_UPDATES = (Messages.SET_STATE_INFO, Messages.SET_DEVICE_STATE)
+
+
+def _entity_key(item):
+    if 'deviceId' in item:
+        return ('device', item['deviceId'])
+    if 'roomId' in item:
+        return ('room', item['roomId'])
+    if 'compId' in item:
+        return ('comp', item['compId'])
+    return None
+
+
+def _state_items(message):
+    if message.get('type_int') == Messages.SET_STATE_INFO:
+        return message['payload'].get('item', [])
+    if message.get('type_int') == Messages.SET_DEVICE_STATE:
+        return [message['payload']]
+    return []
+
+
+class ReceiveQueueStats:
+    def __init__(self):
+        self.depth = 0
+        self.max_depth = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    @property
+    def mean_lag(self):
+        return self.total_lag / self.dispatched if self.dispatched else 0.0
+
+    def __str__(self):
+        return f"ReceiveQueueStats(depth={self.depth}, max_depth={self.max_depth}, dispatched={self.dispatched}, dropped={self.dropped}, coalesced={self.coalesced}, mean_lag={self.mean_lag}, max_lag={self.max_lag})"
+
+    __repr__ = __str__
+
+
+class ReceiveQueue:
+    def __init__(self, maxsize: int = 1000, policy: OverflowPolicy = OverflowPolicy.Block):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.stats = ReceiveQueueStats()
+
+        self._queue = deque()
+        self._pending_items = {}
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _coalesce(self, message):
+        items = _state_items(message)
+
+        if not items:
+            return False
+
+        remaining = []
+
+        for item in items:
+            key = _entity_key(item)
+            pending = self._pending_items.get(key) if key is not None else None
+
+            if pending is not None:
+                pending.update(item)
+                self.stats.coalesced += 1
+            else:
+                remaining.append(item)
+
+        if message['type_int'] == Messages.SET_STATE_INFO:
+            message['payload']['item'] = remaining
+
+        return not remaining
+
+    def _drop_oldest_state_update(self):
+        for entry in self._queue:
+            if entry[1].get('type_int') in _STATE_UPDATES:
+                self._queue.remove(entry)
+                self._forget_items(entry[1])
+                self.stats.dropped += 1
+                return True
+
+        return False
+
+    def _remember_items(self, message):
+        for item in _state_items(message):
+            key = _entity_key(item)
+            if key is not None:
+                self._pending_items[key] = item
+
+    def _forget_items(self, message):
+        for item in _state_items(message):
+            key = _entity_key(item)
+            if key is not None and self._pending_items.get(key) is item:
+                del self._pending_items[key]
+
+    def _update_depth(self):
+        stats = self.stats
+        stats.depth = len(self._queue)
+        stats.max_depth = max(stats.max_depth, stats.depth)
+
+        if len(self._queue) >= self.maxsize:
+            self._not_full.clear()
+        else:
+            self._not_full.set()
+
+    async def put(self, message):
+        if self.policy == OverflowPolicy.Coalesce and self._coalesce(message):
+            return
+
+        while len(self._queue) >= self.maxsize:
+            if self.policy == OverflowPolicy.DropOldest and self._drop_oldest_state_update():
+                break
+
+            # Topology and other messages are never dropped
+            await self._not_full.wait()
+
+        self._queue.append((time.monotonic(), message))
+
+        if self.policy == OverflowPolicy.Coalesce:
+            self._remember_items(message)
+
+        self._update_depth()
+        self._not_empty.set()
+
+    def close(self):
+        # get() returns None once everything queued so far is dispatched
+        self._closed = True
+        self._not_empty.set()
+
+    async def get(self):
+        while not self._queue:
+            if self._closed:
+                return None
+
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        enqueued_at, message = self._queue.popleft()
+
+        if self.policy == OverflowPolicy.Coalesce:
+            self._forget_items(message)
+
+        lag = time.monotonic() - enqueued_at
+        stats = self.stats
+        stats.dispatched += 1
+        stats.last_lag = lag
+        stats.total_lag += lag
+        stats.max_lag = max(stats.max_lag, lag)
+
+        self._update_depth()
+
+        return message
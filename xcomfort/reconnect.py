@@ -0,0 +1,98 @@
+import random
+import time
+from enum import Enum
+from .connection import ConnectionDeclinedError
+
+
+class ConnectionStatus(Enum):
+    Connecting = 1
+    Connected = 2
+    Disconnected = 3
+    Waiting = 4
+    CircuitOpen = 5
+    Closed = 6
+
+
+class ConnectionEvent:
+    def __init__(self, status: ConnectionStatus, attempt=0, error=None, delay=None, time_to_recover=None):
+        self.status = status
+        self.attempt = attempt
+        self.error = error
+        self.delay = delay
+        self.time_to_recover = time_to_recover
+        self.timestamp = time.time()
+
+    def __str__(self):
+        return f"ConnectionEvent({self.status.name}, attempt={self.attempt}, delay={self.delay}, error={self.error!r})"
+
+    __repr__ = __str__
+
+
+class ReconnectPolicy:
+    def __init__(self,
+                 first_delay=0.0,
+                 base_delay=1.0,
+                 max_delay=60.0,
+                 multiplier=2.0,
+                 jitter=0.25,
+                 declined_delay=15.0,
+                 stable_after=30.0,
+                 failure_threshold=20,
+                 open_time=300.0):
+        self.first_delay = first_delay
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        # The bridge has a small number of client slots. When it declines us,
+        # retrying quickly only keeps the slots busy, so back off harder.
+        self.declined_delay = declined_delay
+        # A connection only counts as recovered once it has stayed up this long
+        self.stable_after = stable_after
+        self.failure_threshold = failure_threshold
+        self.open_time = open_time
+
+        self.failures = 0
+        self._connected_at = None
+
+    @property
+    def circuit_open(self):
+        return self.failure_threshold is not None and self.failures >= self.failure_threshold
+
+    def connected(self):
+        self._connected_at = time.monotonic()
+
+    def reset(self):
+        self.failures = 0
+        self._connected_at = None
+
+    def _jittered(self, delay):
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+
+        return max(0.0, delay)
+
+    def next_delay(self, error=None):
+        if self._connected_at is not None and time.monotonic() - self._connected_at >= self.stable_after:
+            self.reset()
+
+        self._connected_at = None
+        self.failures += 1
+
+        if self.circuit_open:
+            # Only one probe per cooldown until a connection holds again
+            return self._jittered(self.open_time)
+
+        if self.failures == 1 and not isinstance(error, ConnectionDeclinedError):
+            return self.first_delay
+
+        if isinstance(error, ConnectionDeclinedError):
+            base, attempt = self.declined_delay, self.failures - 1
+        else:
+            # The immediate retry used up the first failure, so backoff
+            # starts at base_delay on the second one
+            base, attempt = self.base_delay, max(0, self.failures - 2)
+
+        delay = min(self.max_delay, base * self.multiplier ** attempt)
+
+        return self._jittered(delay)
@@ -9,6 +9,7 @@ from enum import Enum
 from .connection import SecureBridgeConnection, setup_secure_connection
 from .messages import Messages
 from .devices import (BridgeDevice, Light, RcTouch, Heater, Shade)
+from .state import StatePublisher, FrozenState
 
 class RctMode(Enum):
     Cool = 1
@@ -25,58 +26,64 @@ class RctModeRange:
         self.Min = min
         self.Max = max
 
-class RoomState:
+class RoomState(FrozenState):
+    __slots__ = ('setpoint', 'temperature', 'humidity', 'power', 'mode', 'rctstate', 'raw')
+    _fields = ('setpoint', 'temperature', 'humidity', 'power', 'mode', 'rctstate')
+
     def __init__(self, setpoint, temperature, humidity, power, mode:RctMode, state:RctState,  raw):
-        self.setpoint = setpoint
-        self.temperature = temperature
-        self.humidity = humidity
-        self.power = power
-        self.mode = mode
-        self.raw = raw
-        self.rctstate = state
+        FrozenState.__init__(self, setpoint=setpoint, temperature=temperature, humidity=humidity,
+                             power=power, mode=mode, rctstate=state, raw=raw)
 
     def __str__(self):
         return f"RoomState({self.setpoint}, {self.temperature}, {self.humidity},{self.mode},{self.rctstate} {self.power})"
 
     __repr__ = __str__
 
-class Room:
-    def __init__(self, bridge, room_id, name: str):
+class Room(StatePublisher):
+    def __init__(self, bridge, room_id, name: str, device_ids=()):
         self.bridge = bridge
         self.room_id = room_id
         self.name = name
-        self.state = rx.subject.BehaviorSubject(None)
+        self.device_ids = list(device_ids)
+        self._init_state()
         self.modesetpoints = dict()
 
     def handle_state(self, payload):
         print(f"Room.handle_state: {payload}")
 
-        old_state = self.state.value
+        old_state = self.confirmed_state
 
-        if old_state is not None:
-            old_state.raw.update(payload)
-            payload = old_state.raw
+        # Payloads are partial, so fields they don't carry keep their last
+        # value instead of re-reading an ever-growing merged payload.
+        def previous(name, default=None):
+            return getattr(old_state, name) if old_state is not None else default
 
-        setpoint = payload.get('setpoint', None)
-        temperature = payload.get('temp', None)
-        humidity = payload.get('humidity', None)
-        power = payload.get('power', 0.0)
+        setpoint = payload.get('setpoint', previous('setpoint'))
+        temperature = payload.get('temp', previous('temperature'))
+        humidity = payload.get('humidity', previous('humidity'))
+        power = payload.get('power', previous('power', 0.0))
 
+        mode = previous('mode')
         if 'currentMode' in payload:                # When handling from _SET_ALL_DATA
-            mode = RctMode(payload.get('currentMode', None))
+            mode = RctMode(payload['currentMode'])
         if 'mode' in payload:                       # When handling from _SET_STATE_INFO
-            mode = RctMode(payload.get('mode', None))
+            mode = RctMode(payload['mode'])
 
         # When handling from _SET_ALL_DATA, we get the setpoints for each mode/preset
         # Store these for later use
         if 'modes' in payload:
-            for mode in payload["modes"]:
-                self.modesetpoints[RctMode(mode["mode"])] = float(mode["value"])
+            for mode_setpoint in payload["modes"]:
+                self.modesetpoints[RctMode(mode_setpoint["mode"])] = float(mode_setpoint["value"])
 
+        currentstate = previous('rctstate')
         if 'state' in payload:
-            currentstate = RctState(payload.get('state', None))
+            currentstate = RctState(payload['state'])
+
+        raw = self._retain_raw(payload)
+        if raw is not None and old_state is not None and old_state.raw is not None:
+            raw = {**old_state.raw, **raw}
 
-        self.state.on_next(RoomState(setpoint,temperature,humidity,power,mode,currentstate,payload))
+        self._publish_state(RoomState(setpoint,temperature,humidity,power,mode,currentstate,raw))
 
     async def set_target_temperature(self, setpoint: float):
 
@@ -93,14 +100,28 @@ class Room:
         # Store new setpoint for current mode
         self.modesetpoints[self.state.value.mode.value] = setpoint
 
-        await self.bridge.send_message(Messages.SET_HEATING_STATE, {"roomId":self.room_id,"mode":self.state.value.mode.value,"state":self.state.value.rctstate.value,"setpoint":setpoint,"confirmed":False})
+        await self._send_optimistic(
+            self.bridge.send_message(Messages.SET_HEATING_STATE, {"roomId":self.room_id,"mode":self.state.value.mode.value,"state":self.state.value.rctstate.value,"setpoint":setpoint,"confirmed":False}),
+            setpoint=setpoint)
 
     async def set_mode(self, mode:RctMode):
 
         #Find setpoint for the mode we are about to set, and use that
         #When transmitting heating_state message.
         newsetpoint = self.modesetpoints.get(mode)
-        await self.bridge.send_message(Messages.SET_HEATING_STATE, {"roomId":self.room_id,"mode":mode.value,"state":self.state.value.rctstate.value,"setpoint":newsetpoint,"confirmed":False})
+        expected = {"mode": mode} if newsetpoint is None else {"mode": mode, "setpoint": newsetpoint}
+
+        await self._send_optimistic(
+            self.bridge.send_message(Messages.SET_HEATING_STATE, {"roomId":self.room_id,"mode":mode.value,"state":self.state.value.rctstate.value,"setpoint":newsetpoint,"confirmed":False}),
+            **expected)
+
+    async def switch(self, switch: bool):
+        # One frame for every light in the room
+        return await self.bridge.switch_room(self.room_id, {"switch": switch})
+
+    async def dimm(self, value: int):
+        value = max(0, min(99, value))
+        return await self.bridge.slide_room(self.room_id, {"dimmvalue": value})
 
     def __str__(self):
         return f"Room({self.room_id}, \"{self.name}\")"
@@ -0,0 +1,23 @@
+class Scene:
+    def __init__(self, bridge, scene_id, name: str, devices=()):
+        self.bridge = bridge
+        self.scene_id = scene_id
+        self.name = name
+        self.device_ids = devices
+
+    @property
+    def device_ids(self):
+        return self._device_ids
+
+    @device_ids.setter
+    def device_ids(self, devices):
+        # Scene payloads list either device ids or {"deviceId": ..., "value": ...}
+        self._device_ids = [device["deviceId"] if isinstance(device, dict) else device for device in devices]
+
+    async def activate(self):
+        return await self.bridge.activate_scene(self.scene_id)
+
+    def __str__(self):
+        return f'Scene({self.scene_id}, "{self.name}", devices: {self.device_ids})'
+
+    __repr__ = __str__
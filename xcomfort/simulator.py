@@ -0,0 +1,576 @@
+import asyncio
+import json
+import math
+import random
+import secrets
+import time
+from aiohttp import web, WSMsgType
+from base64 import b64encode, b64decode
+from Crypto.PublicKey import RSA
+from Crypto.Cipher import PKCS1_v1_5, AES
+from .connection import hash, _pad_string
+from .messages import Messages
+
+
+class SimulatorConfig:
+    def __init__(self,
+                 devices=100,
+                 rooms=10,
+                 comps=10,
+                 scenes=0,
+                 chunk_size=500,
+                 dimmable_ratio=0.5,
+                 state_rate=0.0,
+                 state_batch=1,
+                 latency=0.0,
+                 jitter=0.0,
+                 drop_rate=0.0,
+                 nack_rate=0.0,
+                 token_lifetime=8640000,
+                 max_clients=4,
+                 rsa_bits=2048,
+                 seed=None):
+        self.devices = devices
+        self.rooms = rooms
+        self.comps = comps
+        self.scenes = scenes
+        self.chunk_size = chunk_size
+        self.dimmable_ratio = dimmable_ratio
+        # SET_STATE_INFO frames per second, and items per frame
+        self.state_rate = state_rate
+        self.state_batch = state_batch
+        # Seconds added before every response sent by the simulator
+        self.latency = latency
+        self.jitter = jitter
+        # Probability that a command is silently dropped or NACKed
+        self.drop_rate = drop_rate
+        self.nack_rate = nack_rate
+        self.token_lifetime = token_lifetime
+        self.max_clients = max_clients
+        self.rsa_bits = rsa_bits
+        self.seed = seed
+
+
+class SimulatorStats:
+    def __init__(self):
+        self.connections = 0
+        self.logins = 0
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.acks_received = 0
+        self.commands_received = 0
+        self.commands_dropped = 0
+        self.commands_nacked = 0
+        self.room_commands_received = 0
+        self.scene_activations = 0
+        self.state_updates_sent = 0
+
+    def __str__(self):
+        return f"SimulatorStats({self.__dict__})"
+
+    __repr__ = __str__
+
+
+class BridgeSimulator:
+    def __init__(self, authkey: str, config: SimulatorConfig = None, device_id: str = None):
+        self.authkey = authkey
+        self.config = config or SimulatorConfig()
+        self.device_id = device_id or secrets.token_hex(6)
+        self.stats = SimulatorStats()
+
+        self._random = random.Random(self.config.seed)
+        self._rsa = None
+        self._runner = None
+        self._site = None
+        self._clients = set()
+        self._tokens = {}
+
+        self.devices = {}
+        self.rooms = {}
+        self.comps = {}
+        self.scenes = {}
+        self._build_topology()
+
+        self.host = None
+        self.port = None
+
+    @property
+    def ip_address(self):
+        return f"{self.host}:{self.port}"
+
+    def _build_topology(self):
+        config = self.config
+
+        for i in range(config.comps):
+            comp_id = i + 1
+            self.comps[comp_id] = {
+                "compId": comp_id,
+                "name": f"Comp {comp_id}",
+                "compType": 83,
+            }
+
+        for i in range(config.rooms):
+            room_id = i + 1
+            self.rooms[room_id] = {
+                "roomId": room_id,
+                "name": f"Room {room_id}",
+                "devices": [],
+                "currentMode": 1,
+                "mode": 1,
+                "state": 0,
+                "setpoint": 20.0,
+                "temp": 21.0,
+                "humidity": 40.0,
+                "power": 0.0,
+            }
+
+        for i in range(config.devices):
+            device_id = i + 1
+            dimmable = self._random.random() < config.dimmable_ratio
+            comp_id = (i % config.comps) + 1 if config.comps else None
+
+            self.devices[device_id] = {
+                "deviceId": device_id,
+                "name": f"Light {device_id}",
+                "devType": 100 if dimmable else 101,
+                "compId": comp_id,
+                "dimmable": dimmable,
+                "switch": False,
+                "dimmvalue": 0,
+            }
+
+            if config.rooms:
+                room = self.rooms[(i % config.rooms) + 1]
+                room["devices"].append(device_id)
+
+        # Scene 1 turns everything off, later scenes set increasing levels
+        for i in range(config.scenes):
+            scene_id = i + 1
+            self.scenes[scene_id] = {
+                "sceneId": scene_id,
+                "name": f"Scene {scene_id}",
+                "devices": [{"deviceId": device_id, "value": min(99, 33 * i)} for device_id in self.devices],
+            }
+
+    async def start(self, host="127.0.0.1", port=0):
+        if self._rsa is None:
+            self._rsa = RSA.generate(self.config.rsa_bits)
+
+        app = web.Application()
+        app.router.add_get("/", self._handle_websocket)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        self._site = web.TCPSite(self._runner, host, port)
+        await self._site.start()
+
+        self.host = host
+        self.port = self._runner.addresses[0][1]
+
+        return self
+
+    async def stop(self):
+        for client in list(self._clients):
+            await client.close()
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    async def _handle_websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        client = _SimulatedClient(self, ws)
+
+        if len(self._clients) >= self.config.max_clients:
+            await client.send_plain({
+                "type_int": Messages.NACK,
+                "ref": -1,
+                "info": "no client-connection available (all used)!"
+            })
+            await ws.close()
+            return ws
+
+        self._clients.add(client)
+        self.stats.connections += 1
+
+        try:
+            await client.run()
+        finally:
+            self._clients.discard(client)
+            await client.stop()
+
+        return ws
+
+    def issue_token(self):
+        token = secrets.token_hex(16)
+        self._tokens[token] = time.monotonic() + self.config.token_lifetime
+        return token
+
+    def token_remaining(self, token):
+        expires = self._tokens.get(token)
+
+        if expires is None:
+            return 0
+
+        return max(0, math.ceil(expires - time.monotonic()))
+
+    def revoke_token(self, token):
+        self._tokens.pop(token, None)
+
+    def all_data_chunks(self):
+        devices = list(self.devices.values())
+        chunk_size = max(1, self.config.chunk_size)
+        chunks = [devices[i:i + chunk_size] for i in range(0, len(devices), chunk_size)] or [[]]
+
+        for index, chunk in enumerate(chunks):
+            payload = {"devices": chunk}
+
+            if index == 0:
+                payload["comps"] = list(self.comps.values())
+                payload["rooms"] = list(self.rooms.values())
+                if self.scenes:
+                    payload["scenes"] = list(self.scenes.values())
+
+            if index == len(chunks) - 1:
+                payload["lastItem"] = True
+
+            yield payload
+
+    def random_state_item(self):
+        device = self.devices[self._random.randint(1, len(self.devices))]
+        device["switch"] = self._random.random() < 0.5
+
+        item = {"deviceId": device["deviceId"], "switch": device["switch"]}
+
+        if device["dimmable"]:
+            device["dimmvalue"] = self._random.randint(1, 99)
+            item["dimmvalue"] = device["dimmvalue"]
+
+        return item
+
+    async def broadcast(self, message_type, payload):
+        for client in list(self._clients):
+            if client.authenticated:
+                await client.send_message(message_type, payload)
+
+
+class _SimulatedClient:
+    def __init__(self, simulator, ws):
+        self.simulator = simulator
+        self.ws = ws
+        self.key = None
+        self.iv = None
+        self.mc = 0
+        self.token = None
+        self.authenticated = False
+        self._storm = None
+        # Commands are handled in their own tasks so injected latency does
+        # not serialize them; frames are written one at a time
+        self._commands = set()
+        self._write_lock = asyncio.Lock()
+
+    @property
+    def config(self):
+        return self.simulator.config
+
+    @property
+    def stats(self):
+        return self.simulator.stats
+
+    async def _delay(self):
+        latency = self.config.latency
+
+        if self.config.jitter:
+            latency += self.simulator._random.uniform(0, self.config.jitter)
+
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+    async def send_plain(self, data):
+        async with self._write_lock:
+            await self.ws.send_str(json.dumps(data) + '\u0004')
+        self.stats.frames_sent += 1
+
+    async def send(self, data):
+        msg = _pad_string(json.dumps(data).encode())
+        msg = AES.new(self.key, AES.MODE_CBC, self.iv).encrypt(msg)
+        async with self._write_lock:
+            await self.ws.send_str(b64encode(msg).decode() + '\u0004')
+        self.stats.frames_sent += 1
+
+    async def send_message(self, message_type, payload):
+        self.mc += 1
+        await self.send({"type_int": int(message_type), "mc": self.mc, "payload": payload})
+
+    def decrypt(self, data):
+        ct = b64decode(data.rstrip('\u0004'))
+        data = AES.new(self.key, AES.MODE_CBC, self.iv).decrypt(ct).rstrip(b'\x00')
+
+        if not data:
+            return {}
+
+        return json.loads(data.decode())
+
+    async def run(self):
+        simulator = self.simulator
+
+        await self.send_plain({
+            "type_int": Messages.CONNECTION_START,
+            "mc": -1,
+            "payload": {
+                "device_id": simulator.device_id,
+                "connection_id": secrets.token_hex(8)
+            }
+        })
+
+        async for msg in self.ws:
+            if msg.type != WSMsgType.TEXT:
+                break
+
+            self.stats.frames_received += 1
+
+            if self.key is None:
+                await self._handle_plain(json.loads(msg.data.rstrip('\u0004')))
+            else:
+                await self._handle(self.decrypt(msg.data))
+
+    async def _handle_plain(self, msg):
+        message_type = msg.get("type_int")
+
+        if message_type == Messages.CONNECTION_CONFIRM:
+            await self.send_plain({"type_int": Messages.CONNECTION_ESTABLISHED, "mc": -1})
+
+        elif message_type == Messages.SC_INIT:
+            public_key = self.simulator._rsa.publickey().export_key().decode()
+            await self.send_plain({
+                "type_int": Messages.SC_PUBKEY,
+                "mc": -1,
+                "payload": {"public_key": public_key}
+            })
+
+        elif message_type == Messages.SC_SECRET:
+            cipher = PKCS1_v1_5.new(self.simulator._rsa)
+            secret = cipher.decrypt(b64decode(msg["payload"]["secret"]), None)
+
+            if secret is None:
+                await self.send_plain({"type_int": Messages.SC_INVALID, "mc": -1})
+                await self.ws.close()
+                return
+
+            key, iv = secret.decode().split(":::")
+            self.key = bytes.fromhex(key)
+            self.iv = bytes.fromhex(iv)
+
+            await self.send({"type_int": Messages.SC_ESTABLISHED, "mc": -1})
+
+    async def _handle(self, msg):
+        message_type = msg.get("type_int")
+        payload = msg.get("payload", {})
+        simulator = self.simulator
+
+        if message_type == Messages.ACK:
+            self.stats.acks_received += 1
+            return
+
+        if message_type == Messages.AUTH_LOGIN:
+            salt = payload.get("salt", "")
+            expected = hash(simulator.device_id.encode(), simulator.authkey.encode(), salt.encode())
+
+            if payload.get("password") != expected:
+                await self.send({"type_int": Messages.AUTH_LOGIN_DENIED, "mc": -1, "payload": {}})
+                return
+
+            self.stats.logins += 1
+            await self.send({
+                "type_int": Messages.AUTH_LOGIN_SUCCESS,
+                "mc": -1,
+                "payload": {"token": simulator.issue_token()}
+            })
+            return
+
+        if message_type in (Messages.AUTH_APPLY_TOKEN, Messages.AUTH_VERIFY_TOKEN):
+            token = payload.get("token")
+            remaining = simulator.token_remaining(token)
+            valid = remaining > 0
+
+            if message_type == Messages.AUTH_APPLY_TOKEN and valid:
+                self.token = token
+                self.authenticated = True
+
+            response = Messages.AUTH_APPLY_TOKEN_RESPONSE if message_type == Messages.AUTH_APPLY_TOKEN \
+                else Messages.AUTH_VERIFY_TOKEN_RESPONSE
+
+            await self.send({
+                "type_int": response,
+                "mc": -1,
+                "payload": {"valid": valid, "remaining": remaining}
+            })
+            return
+
+        if message_type == Messages.AUTH_RENEW_TOKEN:
+            token = payload.get("token")
+
+            if simulator.token_remaining(token) <= 0:
+                await self.send({"type_int": Messages.AUTH_LOGIN_DENIED, "mc": -1, "payload": {}})
+                return
+
+            simulator.revoke_token(token)
+            await self.send({
+                "type_int": Messages.AUTH_RENEW_TOKEN_RESPONSE,
+                "mc": -1,
+                "payload": {"token": simulator.issue_token()}
+            })
+            return
+
+        if not self.authenticated:
+            await self.send({"type_int": Messages.NACK, "ref": msg.get("mc", -1), "info": "not authenticated"})
+            return
+
+        task = asyncio.ensure_future(self._handle_command(message_type, msg.get("mc"), payload))
+        self._commands.add(task)
+        task.add_done_callback(self._commands.discard)
+
+    async def _handle_command(self, message_type, mc, payload):
+        simulator = self.simulator
+        config = self.config
+
+        if message_type == Messages.HEARTBEAT:
+            return
+
+        if message_type == Messages.INITIAL_DATA:
+            for chunk in simulator.all_data_chunks():
+                await self._delay()
+                await self.send_message(Messages.SET_ALL_DATA, chunk)
+
+            self._start_storm()
+            return
+
+        if message_type == Messages.HOME_DATA:
+            await self.send_message(Messages.SET_HOME_DATA, {"name": "Simulated home"})
+            return
+
+        self.stats.commands_received += 1
+
+        if simulator._random.random() < config.drop_rate:
+            self.stats.commands_dropped += 1
+            return
+
+        await self._delay()
+
+        if simulator._random.random() < config.nack_rate:
+            self.stats.commands_nacked += 1
+            await self.send({"type_int": Messages.NACK, "ref": mc, "info": Messages.NACK_INFO_INVALID_ACTION.value})
+            return
+
+        if message_type in (Messages.ACTION_SWITCH_DEVICE, Messages.ACTION_SLIDE_DEVICE):
+            device = simulator.devices.get(payload.get("deviceId"))
+
+            if device is None:
+                await self.send({"type_int": Messages.NACK, "ref": mc, "info": Messages.NACK_INFO_UNKNOWN_DEVICE.value})
+                return
+
+            if message_type == Messages.ACTION_SLIDE_DEVICE and not device["dimmable"]:
+                await self.send({"type_int": Messages.NACK, "ref": mc, "info": Messages.NACK_INFO_DEVICE_NOT_DIMMABLE.value})
+                return
+
+            if "switch" in payload:
+                device["switch"] = bool(payload["switch"])
+
+            if "dimmvalue" in payload:
+                device["dimmvalue"] = payload["dimmvalue"]
+                device["switch"] = payload["dimmvalue"] > 0
+
+            await self.send({"type_int": Messages.ACK, "ref": mc})
+            await simulator.broadcast(Messages.SET_STATE_INFO, {"item": [self._device_state_item(device)]})
+            return
+
+        if message_type in (Messages.ACTION_SWITCH_ROOM, Messages.ACTION_SLIDE_ROOM):
+            room = simulator.rooms.get(payload.get("roomId"))
+
+            if room is None:
+                await self.send({"type_int": Messages.NACK, "ref": mc, "info": Messages.NACK_INFO_INVALID_ACTION.value})
+                return
+
+            devices = [simulator.devices[device_id] for device_id in room["devices"] if device_id in simulator.devices]
+
+            for device in devices:
+                if "switch" in payload:
+                    device["switch"] = bool(payload["switch"])
+
+                if "dimmvalue" in payload and device["dimmable"]:
+                    device["dimmvalue"] = payload["dimmvalue"]
+                    device["switch"] = payload["dimmvalue"] > 0
+
+            self.stats.room_commands_received += 1
+            await self.send({"type_int": Messages.ACK, "ref": mc})
+            await simulator.broadcast(Messages.SET_STATE_INFO, {"item": [self._device_state_item(device) for device in devices]})
+            return
+
+        if message_type == Messages.ACTIVATE_SCENE:
+            scene = simulator.scenes.get(payload.get("sceneId"))
+
+            if scene is None:
+                await self.send({"type_int": Messages.NACK, "ref": mc, "info": Messages.NACK_INFO_INVALID_ACTION.value})
+                return
+
+            devices = []
+
+            for entry in scene["devices"]:
+                device = simulator.devices.get(entry["deviceId"])
+
+                if device is not None:
+                    device["switch"] = entry["value"] > 0
+                    if device["dimmable"]:
+                        device["dimmvalue"] = entry["value"]
+                    devices.append(device)
+
+            self.stats.scene_activations += 1
+            await self.send({"type_int": Messages.ACK, "ref": mc})
+            await simulator.broadcast(Messages.SET_STATE_INFO, {"item": [self._device_state_item(device) for device in devices]})
+            return
+
+        await self.send({"type_int": Messages.ACK, "ref": mc})
+
+    def _device_state_item(self, device):
+        item = {"deviceId": device["deviceId"], "switch": device["switch"]}
+        if device["dimmable"]:
+            item["dimmvalue"] = device["dimmvalue"]
+
+        return item
+
+    def _start_storm(self):
+        if self._storm is None and self.config.state_rate > 0 and self.simulator.devices:
+            self._storm = asyncio.ensure_future(self._state_storm())
+
+    async def _state_storm(self):
+        simulator = self.simulator
+        interval = 1.0 / self.config.state_rate
+        next_time = time.monotonic()
+
+        while not self.ws.closed:
+            items = [simulator.random_state_item() for _ in range(self.config.state_batch)]
+            await self.send_message(Messages.SET_STATE_INFO, {"item": items})
+            self.stats.state_updates_sent += len(items)
+
+            next_time += interval
+            await asyncio.sleep(max(0, next_time - time.monotonic()))
+
+    async def stop(self):
+        if self._storm is not None:
+            self._storm.cancel()
+            self._storm = None
+
+        for task in list(self._commands):
+            task.cancel()
+
+    async def close(self):
+        await self.stop()
+        await self.ws.close()
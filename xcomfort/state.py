@@ -0,0 +1,178 @@
+import asyncio
+from rx.subject import BehaviorSubject, Subject
+
+_MISSING = object()
+
+
+def retain_raw(payload, keys):
+    # keys None keeps the whole payload, an empty collection keeps nothing
+    # and otherwise only the listed keys are kept.
+    if keys is None or payload is None:
+        return payload
+
+    if not keys:
+        return None
+
+    return {key: payload[key] for key in keys if key in payload}
+
+
+class FrozenState:
+    # pending marks a state published optimistically, before the bridge
+    # confirmed it
+    __slots__ = ('pending',)
+
+    def __init__(self, **fields):
+        object.__setattr__(self, 'pending', False)
+
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def replace(self, **changes):
+        state = object.__new__(type(self))
+
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name not in changes and hasattr(self, name):
+                    object.__setattr__(state, name, getattr(self, name))
+
+        for name, value in changes.items():
+            object.__setattr__(state, name, value)
+
+        return state
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __setstate__(self, state):
+        # Used by copy and pickle, which would otherwise go through __setattr__
+        if isinstance(state, tuple):
+            state = state[1]
+
+        for name, value in (state or {}).items():
+            object.__setattr__(self, name, value)
+
+
+class StateDelta:
+    def __init__(self, entity, state, changed: dict, previous: dict):
+        self.entity = entity
+        self.state = state
+        # field -> new value, and field -> value before the change
+        self.changed = changed
+        self.previous = previous
+
+    def __str__(self):
+        return f"StateDelta({self.changed}, previous={self.previous})"
+
+    __repr__ = __str__
+
+
+def changed_fields(old, new):
+    fields = type(new)._fields
+
+    if old is None or type(old) is not type(new):
+        return {name: getattr(new, name, None) for name in fields}, {}
+
+    changed = {}
+    previous = {}
+
+    for name in fields:
+        value = getattr(new, name, None)
+        old_value = getattr(old, name, _MISSING)
+
+        if old_value is _MISSING or old_value != value:
+            changed[name] = value
+            previous[name] = None if old_value is _MISSING else old_value
+
+    return changed, previous
+
+
+class StatePublisher:
+    # Mixin for devices, rooms and comps. state only emits when one of the
+    # state class' _fields changed; deltas carries the changed fields.
+    def _init_state(self):
+        self.state = BehaviorSubject(None)
+        self.deltas = Subject()
+        self._confirmed_state = None
+
+    @property
+    def confirmed_state(self):
+        # Latest state reported by the bridge, ignoring optimistic ones
+        return self._confirmed_state
+
+    def _retain_raw(self, payload):
+        return retain_raw(payload, getattr(self.bridge, 'raw_payload_keys', ()))
+
+    async def wait_for_state(self, predicate=None, timeout: float | None = None):
+        # Resolves with the current or next state for which predicate(state)
+        # is true, or the first state at all when no predicate is given.
+        future = asyncio.get_event_loop().create_future()
+
+        def on_state(state):
+            if state is None or future.done():
+                return
+
+            try:
+                if predicate is None or predicate(state):
+                    future.set_result(state)
+            except Exception as e:
+                future.set_exception(e)
+
+        subscription = self.state.subscribe(on_state)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            subscription.dispose()
+
+    async def _send_optimistic(self, command, **expected):
+        # With bridge.optimistic set, publishes the expected state as pending
+        # while command is in flight. A real update replaces it; if the
+        # command fails, or no update follows its ACK within
+        # bridge.optimistic_timeout, the last confirmed state is restored.
+        current = self.state.value
+
+        if not getattr(self.bridge, 'optimistic', False) or current is None:
+            return await command
+
+        optimistic = current.replace(pending=True, **expected)
+        self._publish_state(optimistic)
+
+        try:
+            result = await command
+        except Exception:
+            self._roll_back(optimistic)
+            raise
+
+        if self.state.value is optimistic:
+            asyncio.get_event_loop().call_later(
+                getattr(self.bridge, 'optimistic_timeout', 2.0), self._roll_back, optimistic)
+
+        return result
+
+    def _roll_back(self, optimistic):
+        if self.state.value is optimistic and self._confirmed_state is not None:
+            self._publish_state(self._confirmed_state)
+
+    def _publish_state(self, new_state):
+        old_state = self.state.value
+        changed, previous = changed_fields(old_state, new_state)
+
+        if not new_state.pending:
+            self._confirmed_state = new_state
+
+        if old_state is not None and old_state.pending != new_state.pending:
+            changed['pending'] = new_state.pending
+            previous['pending'] = old_state.pending
+
+        if old_state is not None and not changed:
+            return False
+
+        self.state.on_next(new_state)
+
+        if self.deltas.observers:
+            self.deltas.on_next(StateDelta(self, new_state, changed, previous))
+
+        return True
@@ -0,0 +1,71 @@
+import json
+import os
+import time
+
+
+class StoredToken:
+    def __init__(self, token: str, expires: float):
+        self.token = token
+        self.expires = expires
+
+    @property
+    def remaining(self):
+        return self.expires - time.time()
+
+    def is_valid(self, margin=60):
+        return self.remaining > margin
+
+    def __str__(self):
+        return f"StoredToken(expires={self.expires})"
+
+    __repr__ = __str__
+
+
+class MemoryTokenStore:
+    def __init__(self):
+        self._tokens = {}
+
+    def load(self, device_id):
+        return self._tokens.get(device_id)
+
+    def save(self, device_id, token: str, remaining: float):
+        self._tokens[device_id] = StoredToken(token, time.time() + remaining)
+
+    def clear(self, device_id):
+        self._tokens.pop(device_id, None)
+
+
+class FileTokenStore(MemoryTokenStore):
+    def __init__(self, path):
+        MemoryTokenStore.__init__(self)
+        self.path = path
+        self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        for device_id, item in data.items():
+            self._tokens[device_id] = StoredToken(item["token"], item["expires"])
+
+    def _write(self):
+        data = {device_id: {"token": t.token, "expires": t.expires}
+                for device_id, t in self._tokens.items()}
+
+        tmp_path = f"{self.path}.tmp"
+        # Tokens grant full access to the bridge, keep the file private
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def save(self, device_id, token: str, remaining: float):
+        MemoryTokenStore.save(self, device_id, token, remaining)
+        self._write()
+
+    def clear(self, device_id):
+        if device_id in self._tokens:
+            MemoryTokenStore.clear(self, device_id)
+            self._write()
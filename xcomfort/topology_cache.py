@@ -0,0 +1,32 @@
+import json
+import os
+
+
+class TopologyCache:
+    # Entity payloads from SET_ALL_DATA with later state items merged in, so a
+    # restarted Bridge can show the last known topology and states before the
+    # bridge has answered.
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(data, dict) or data.get("version") != self.version:
+            return None
+
+        return {kind: data.get(kind, []) for kind in ("comps", "rooms", "devices", "scenes")}
+
+    def save(self, comps, rooms, devices, scenes=()):
+        data = {"version": self.version, "comps": comps, "rooms": rooms, "devices": devices, "scenes": list(scenes)}
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
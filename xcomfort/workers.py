@@ -0,0 +1,343 @@
+import asyncio
+import multiprocessing
+import rx
+from concurrent.futures import ThreadPoolExecutor
+from .group import BridgeGroup, GroupState
+
+
+def _state_fields(state):
+    if hasattr(state, "__dict__"):
+        fields = dict(vars(state))
+    else:
+        fields = {name: getattr(state, name) for cls in type(state).__mro__
+                  for name in getattr(cls, "__slots__", ()) if hasattr(state, name)}
+
+    fields.pop("raw", None)
+    return fields
+
+
+_PLAIN_TYPES = (bool, int, float, str, type(None))
+
+
+def _entity_attributes(entity):
+    # Public descriptive attributes that can be sent to the parent as is
+    attributes = {}
+
+    for name, value in vars(entity).items():
+        if name.startswith("_") or name in ("name", "state", "deltas"):
+            continue
+
+        if isinstance(value, _PLAIN_TYPES) or \
+                (isinstance(value, (list, tuple)) and all(isinstance(item, _PLAIN_TYPES) for item in value)):
+            attributes[name] = value
+
+    return attributes
+
+
+def _entity_commands(entity_class):
+    return tuple(name for name in dir(entity_class)
+                 if not name.startswith("_") and asyncio.iscoroutinefunction(getattr(entity_class, name)))
+
+
+class RemoteState:
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+
+    def __str__(self):
+        return f"RemoteState({self.__dict__})"
+
+    __repr__ = __str__
+
+
+class RemoteEntity:
+    def __init__(self, group, bridge_key, kind, entity_id, name, class_name, attributes=None, commands=()):
+        self._group = group
+        self.bridge_key = bridge_key
+        self.kind = kind
+        self.entity_id = entity_id
+        self.state = rx.subject.BehaviorSubject(None)
+        self._fields = {}
+        self._describe(name, class_name, attributes, commands)
+
+    def _describe(self, name, class_name, attributes, commands):
+        self.__dict__.update(attributes or {})
+        self.name = name
+        self.class_name = class_name
+        self._commands = frozenset(commands)
+
+    def _apply_delta(self, delta):
+        self._fields.update(delta)
+        self.state.on_next(RemoteState(self._fields))
+
+    def __getattr__(self, method):
+        # Only the entity's async methods are proxied to the worker
+        if method.startswith("_") or method not in self._commands:
+            raise AttributeError(method)
+
+        async def call(*args):
+            return await self._group._call(self.bridge_key, self.kind, self.entity_id, method, args)
+
+        return call
+
+    def __str__(self):
+        return f"RemoteEntity({self.bridge_key}, {self.kind}, {self.entity_id}, \"{self.name}\", {self.class_name})"
+
+    __repr__ = __str__
+
+
+class _Worker:
+    # Runs inside the worker process. Owns a BridgeGroup and sends state
+    # deltas to the parent in batches, one batch per loop iteration.
+    def __init__(self, conn, bridges, stagger):
+        self.conn = conn
+        self.group = BridgeGroup(stagger=stagger)
+        self.group.logger = lambda x: self._post(("log", x))
+        self._outbox = []
+        self._last_fields = {}
+        self._commands = {}
+        self._closed = None
+
+        for key, ip_address, authkey, kwargs in bridges:
+            bridge = self.group.add_bridge(key, ip_address, authkey, **kwargs)
+            bridge.topology_changes.subscribe(lambda change, key=key: self._on_topology_change(key, change))
+
+        self.group.states.subscribe(self._on_state)
+
+    def _post(self, message):
+        if not self._outbox:
+            asyncio.get_event_loop().call_soon(self._flush)
+
+        self._outbox.append(message)
+
+    def _flush(self):
+        batch, self._outbox = self._outbox, []
+
+        try:
+            self.conn.send(batch)
+        except (OSError, EOFError):
+            pass
+
+    def _on_topology_change(self, bridge_key, change):
+        entity = change.entity
+        entity_id = getattr(entity, f"{change.kind}_id")
+        entity_class = type(entity)
+
+        if change.action in ("added", "removed"):
+            # A re-added entity is new to the parent, so its state must be
+            # sent in full
+            self._last_fields.pop((bridge_key, change.kind, entity_id), None)
+
+        commands = self._commands.get(entity_class)
+        if commands is None:
+            commands = self._commands[entity_class] = _entity_commands(entity_class)
+
+        self._post(("topology", change.action, bridge_key, change.kind, entity_id,
+                    entity.name, entity_class.__name__, _entity_attributes(entity), commands))
+
+    def _on_state(self, event: GroupState):
+        entity_id = getattr(event.entity, f"{event.kind}_id")
+        key = (event.bridge_key, event.kind, entity_id)
+
+        fields = _state_fields(event.state)
+        last = self._last_fields.get(key, {})
+        delta = {name: value for name, value in fields.items() if name not in last or last[name] != value}
+
+        if not delta:
+            return
+
+        self._last_fields[key] = fields
+        self._post(("state", event.bridge_key, event.kind, entity_id, delta))
+
+    def _lookup(self, bridge_key, kind, entity_id):
+        bridge = self.group.bridges[bridge_key]
+        return getattr(bridge, f"_{kind}s")[entity_id]
+
+    async def _call(self, call_id, bridge_key, kind, entity_id, method, args):
+        try:
+            entity = self._lookup(bridge_key, kind, entity_id)
+            result = await getattr(entity, method)(*args)
+            self._post(("result", call_id, result, None))
+        except Exception as e:
+            self._post(("result", call_id, None, repr(e)))
+
+    def _on_command(self, command):
+        if command[0] == "call":
+            asyncio.ensure_future(self._call(*command[1:]))
+
+        elif command[0] == "close":
+            self._closed.set()
+
+    async def _read_commands(self):
+        loop = asyncio.get_event_loop()
+
+        while not self._closed.is_set():
+            try:
+                command = await loop.run_in_executor(None, self.conn.recv)
+            except (OSError, EOFError):
+                self._closed.set()
+                break
+
+            self._on_command(command)
+
+    async def run(self):
+        self._closed = asyncio.Event()
+
+        run_task = asyncio.ensure_future(self.group.run())
+        reader = asyncio.ensure_future(self._read_commands())
+
+        await self._closed.wait()
+        await self.group.close()
+        await run_task
+
+        self._flush()
+        self.conn.send([("closed",)])
+        reader.cancel()
+
+
+async def _run_worker(conn, bridges, stagger):
+    await _Worker(conn, bridges, stagger).run()
+
+
+def _worker_main(conn, bridges, stagger):
+    asyncio.run(_run_worker(conn, bridges, stagger))
+
+
+class ShardedBridgeGroup:
+    def __init__(self, processes: int = None, stagger: float = 0.5, start_method: str = "spawn"):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.stagger = stagger
+        self._context = multiprocessing.get_context(start_method)
+
+        self._configs = {}
+        self._shard_of = {}
+        self._shards = []
+        self._readers = []
+        self._pending = {}
+        self._call_id = 0
+        self._executor = None
+
+        self.devices = {}
+        self.rooms = {}
+        self.comps = {}
+        self.scenes = {}
+        self.states = rx.subject.Subject()
+        self.logger = lambda x: None
+
+    def add_bridge(self, key, ip_address: str, authkey: str, **kwargs):
+        if self._shards:
+            raise Exception("Bridges must be added before run()")
+
+        if key in self._configs:
+            raise Exception(f"Bridge {key} already added")
+
+        self._configs[key] = (key, ip_address, authkey, kwargs)
+
+    def _index(self, kind):
+        return getattr(self, f"{kind}s")
+
+    def _on_message(self, message):
+        kind = message[0]
+
+        if kind == "state":
+            _, bridge_key, entity_kind, entity_id, delta = message
+            entity = self._index(entity_kind).get((bridge_key, entity_id))
+
+            if entity is not None:
+                entity._apply_delta(delta)
+                self.states.on_next(GroupState(bridge_key, entity_kind, entity, entity.state.value))
+
+        elif kind == "topology":
+            _, action, bridge_key, entity_kind, entity_id, name, class_name, attributes, commands = message
+            index = self._index(entity_kind)
+            entity = index.get((bridge_key, entity_id))
+
+            # "found" comps are not part of the home until they are added
+            if action == "removed":
+                index.pop((bridge_key, entity_id), None)
+            elif action == "added" and entity is None:
+                index[(bridge_key, entity_id)] = RemoteEntity(self, bridge_key, entity_kind, entity_id, name, class_name,
+                                                              attributes, commands)
+            elif action == "changed" and entity is not None:
+                entity._describe(name, class_name, attributes, commands)
+
+        elif kind == "result":
+            _, call_id, result, error = message
+            future = self._pending.pop(call_id, None)
+
+            if future is not None and not future.done():
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(Exception(error))
+
+        elif kind == "log":
+            self.logger(message[1])
+
+    async def _read(self, conn):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            try:
+                batch = await loop.run_in_executor(self._executor, conn.recv)
+            except (OSError, EOFError):
+                return
+
+            for message in batch:
+                if message[0] == "closed":
+                    return
+
+                self._on_message(message)
+
+    async def _call(self, bridge_key, kind, entity_id, method, args):
+        self._call_id += 1
+        future = asyncio.get_event_loop().create_future()
+        self._pending[self._call_id] = future
+
+        conn = self._shards[self._shard_of[bridge_key]][1]
+        conn.send(("call", self._call_id, bridge_key, kind, entity_id, method, args))
+
+        return await future
+
+    async def run(self):
+        keys = list(self._configs)
+        count = max(1, min(self.processes, len(keys)))
+        assignments = [[] for _ in range(count)]
+
+        for index, key in enumerate(keys):
+            self._shard_of[key] = index % count
+            assignments[index % count].append(self._configs[key])
+
+        # One blocking reader thread per worker pipe
+        self._executor = ThreadPoolExecutor(max_workers=count)
+
+        for bridges in assignments:
+            parent_conn, child_conn = self._context.Pipe()
+            process = self._context.Process(target=_worker_main, args=(child_conn, bridges, self.stagger), daemon=True)
+            process.start()
+            child_conn.close()
+
+            self._shards.append((process, parent_conn))
+            self._readers.append(asyncio.ensure_future(self._read(parent_conn)))
+
+        await asyncio.gather(*self._readers)
+
+        loop = asyncio.get_event_loop()
+        for process, conn in self._shards:
+            await loop.run_in_executor(self._executor, process.join)
+            conn.close()
+
+        self._executor.shutdown()
+
+    async def close(self):
+        for process, conn in self._shards:
+            try:
+                conn.send(("close",))
+            except (OSError, EOFError):
+                pass
+
+        await asyncio.gather(*self._readers, return_exceptions=True)
+
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(Exception("Worker closed"))
+        self._pending.clear()